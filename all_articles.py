@@ -1,14 +1,14 @@
-from re import sub
-from utils import time_and_date
+from utils import onlyinclude, report_writer
 from wikitools import wiki
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'titles': ['Main', 'Help']}
 
 def main(w):
   all_pages = {language: set() for language in LANGS}
   all_english_pages = set()
-  for page in w.get_all_pages(namespaces=['Main', 'Help']):
+  for page in w.get_all_pages(namespaces=['Main', 'Help'], keep_raw=False):
     if 'OTFWH' in page.title: # ETF2L Highlander Community Challenge/OTFWH
       pass # Do not translate
     elif page.lang == 'en':
@@ -18,41 +18,33 @@ def main(w):
 
   outputs = []
   for language in LANGS:
-    output = """\
-{{{{DISPLAYTITLE: {count} pages in {{{{lang name|name|{lang}}}}}}}}}
-All articles in {{{{lang info|{lang}}}}}; '''<onlyinclude>{count}</onlyinclude>''' in total. Data as of {date}.
-
+    count = len(all_pages[language])
+    report = report_writer()
+    report.header(f'{count} pages in {{{{lang name|name|{language}}}}}',
+      f"All articles in {{{{lang info|{language}}}}}; '''{onlyinclude(count)}''' in total.")
+    report.write(f"""
 ; See also
-* [[Project:Reports/Missing translations/{lang}|Missing translations in {{{{lang name|name|{lang}}}}}]]
-* [[Project:Reports/Missing categories/{lang}|Missing categories in {{{{lang name|name|{lang}}}}}]]
-* [[Special:RecentChangesLinked/Project:Reports/All articles/{lang}|Recent changes to articles in {{{{lang name|name|{lang}}}}}]]
-
-== List ==""".format(
-      lang=language,
-      count=len(all_pages[language]),
-      date=time_and_date())
-
-    if language == 'en': # Fixup, because english doesn't have translations
-      output = output.replace('{{lang name|name|en}}', 'English')
-      output = sub('\n.*?Missing translations/en.*?\n', '\n', output)
+* [[Project:Reports/Missing translations/{language}|Missing translations in {{{{lang name|name|{language}}}}}]]
+* [[Project:Reports/Missing categories/{language}|Missing categories in {{{{lang name|name|{language}}}}}]]
+* [[Special:RecentChangesLinked/Project:Reports/All articles/{language}|Recent changes to articles in {{{{lang name|name|{language}}}}}]]
 
+""")
+    report.heading('List')
     for page in sorted(all_pages[language]):
-      output += f'\n# [[:{page.title}]]'
-    outputs.append([language, output])
-
-  english_output = """\
-{{{{DISPLAYTITLE: {count} pages in {{{{lang name|name|en}}}}}}}}
-List of all English articles; <onlyinclude>{count}</onlyinclude> in total. Data as of {date}.
+      report.item(f'[[:{page.title}]]', '#')
+    outputs.append([language, str(report)])
 
+  count = len(all_english_pages)
+  report = report_writer()
+  report.header(f'{count} pages in {{{{lang name|name|en}}}}', f'List of all English articles; {onlyinclude(count)} in total.')
+  report.write("""
 * ''See also:'' [[Special:RecentChangesLinked/Project:Reports/All articles/en|Recent changes to English articles]]
 
-== List ==""".format(
-    count=len(all_english_pages),
-    date=time_and_date())
+""")
+  report.heading('List')
   for page in sorted(all_english_pages):
-    english_output += f'\n# [[:{page.title}]]'
-
-  outputs.append(['en', english_output])
+    report.item(f'[[:{page.title}]]', '#')
+  outputs.append(['en', str(report)])
 
   return outputs
 
@@ -0,0 +1,123 @@
+# Micro-benchmarks for the CPU-heavy parts of the reports, run against a fixed (generated) corpus so that results are comparable between changes.
+# Usage: python benchmarks/benchmarks.py [bench_name...]
+import inspect
+import sys
+import tracemalloc
+from os import path
+from time import perf_counter
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+import external_links
+import external_links2
+import mismatched
+import untranslated_templates
+from wikitools.fake_wiki import NAMESPACES, SyntheticWiki
+from wikitools.page import Page
+from wikitools.text_cache import TextCache
+from wikitools.compressed_dict import CompressedDict
+
+class CorpusWiki:
+  """Just enough of a Wiki to run page scrapers offline, with every page's text and HTML already cached."""
+
+  def __init__(self, synthetic_wiki, titles):
+    self.api_url = 'https://wiki.teamfortress.com/w/api.php'
+    self.wiki_url = 'https://wiki.teamfortress.com/w/index.php'
+    self.namespaces = {**NAMESPACES, 'Main': 0, '*': '*'}
+    self.page_text_cache = TextCache()
+    self.page_html_cache = CompressedDict()
+    for title in titles:
+      self.page_text_cache[title] = synthetic_wiki.text(title)
+
+  def get_with_continue(self, action, entry_key, **kwargs):
+    return iter([]) # No network, so e.g. every template has 0 transclusions
+
+class Benchmarks:
+  # Class setup
+  def __init__(self):
+    self.synthetic_wiki = SyntheticWiki(2000, seed=0)
+    self.titles = self.synthetic_wiki.titles[NAMESPACES['']] + self.synthetic_wiki.titles[NAMESPACES['Template']]
+    self.wiki = CorpusWiki(self.synthetic_wiki, self.titles)
+    self.pages = [Page(self.wiki, title) for title in self.titles]
+    self.texts = [self.wiki.page_text_cache[title] for title in self.titles]
+    self.html = [self.synthetic_wiki.html(title) for title in self.titles[:500]]
+
+  # Utilities
+  def measure(self, func, items, *, size=None, count=None, repeat=3):
+    count = count or len(items)
+    # Best of N, to reduce noise from the rest of the machine
+    elapsed = float('inf')
+    for _ in range(repeat):
+      start = perf_counter()
+      for item in items:
+        func(item)
+      elapsed = min(elapsed, perf_counter() - start)
+
+    # A separate run for allocations, since tracemalloc slows everything down
+    tracemalloc.start()
+    for item in items:
+      func(item)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = f'{count / elapsed:12,.0f} items/s'
+    if size:
+      result += f' {size / elapsed / 1_000_000:8.2f} MB/s'
+    result += f'   peak {peak / 1000:10,.0f} KB   retained {retained / 1000:10,.0f} KB'
+    return result
+
+  def size(self, strings):
+    return sum(len(string.encode('utf-8')) for string in strings)
+
+  ##################
+  #!# Benchmarks #!#
+  ##################
+
+  def bench_mismatched(self):
+    translation_data = {lang: [] for lang in mismatched.LANGS}
+    return self.measure(lambda page: mismatched.pagescraper(page, translation_data), self.pages, size=self.size(self.texts))
+
+  def bench_untranslated_templates(self):
+    translations = {lang: [] for lang in untranslated_templates.LANGS}
+    return self.measure(lambda page: untranslated_templates.pagescraper(page, translations, {}), self.pages, size=self.size(self.texts))
+
+  def bench_external_links(self):
+    regex = external_links.return_link_regex()
+    return self.measure(lambda text: list(external_links.get_links(regex, text)), self.texts, size=self.size(self.texts))
+
+  def bench_external_links2(self):
+    return self.measure(lambda html: list(external_links2.LINK_REGEX.finditer(html)), self.html, size=self.size(self.html))
+
+  def bench_page_sort(self):
+    titles = [title + suffix for title in self.synthetic_wiki.titles[0][:5000] for suffix in [''] + [f'/{lang}' for lang in untranslated_templates.LANGS[:19]]]
+    return self.measure(lambda titles: sorted(Page(self.wiki, title) for title in titles), [titles], count=len(titles))
+
+  def bench_compressed_dict_set(self):
+    compressed_dict = CompressedDict()
+    return self.measure(lambda title: compressed_dict.__setitem__(title, self.wiki.page_text_cache[title]), self.titles, size=self.size(self.texts))
+
+  def bench_compressed_dict_get(self):
+    compressed_dict = CompressedDict()
+    for title in self.titles:
+      compressed_dict[title] = self.wiki.page_text_cache[title]
+    return self.measure(compressed_dict.get, self.titles, size=self.size(self.texts))
+
+  def bench_compressed_dict_html(self):
+    compressed_dict = CompressedDict()
+    for i, html in enumerate(self.html):
+      compressed_dict[str(i)] = html
+    return f'compressed to {compressed_dict.compressed_bytes / compressed_dict.raw_bytes:.1%} of {compressed_dict.raw_bytes:,} bytes'
+
+if __name__ == '__main__':
+  benchmarks = Benchmarks()
+  print(f'Corpus: {len(benchmarks.texts)} pages ({benchmarks.size(benchmarks.texts):,} bytes of wikitext), {len(benchmarks.html)} pages of HTML ({benchmarks.size(benchmarks.html):,} bytes)')
+
+  def is_benchmark(method):
+    return inspect.ismethod(method) and method.__name__.startswith('bench')
+  benchmarks = list(inspect.getmembers(benchmarks, is_benchmark))
+  benchmarks.sort(key=lambda func: func[1].__code__.co_firstlineno)
+
+  for benchmark in benchmarks:
+    if len(sys.argv) > 1: # Requested specific benchmark(s)
+      if benchmark[0] not in sys.argv[1:]:
+        continue
+    print(f'{benchmark[0]:30} {benchmark[1]()}')
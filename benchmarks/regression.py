@@ -0,0 +1,132 @@
+# End-to-end performance check: runs every report against a synthetic wiki (or a recorded cassette),
+# measures each one in its own process, and compares against a saved baseline.
+# Usage:
+#   python benchmarks/regression.py --save-baseline        # Record the current numbers
+#   python benchmarks/regression.py [--threshold 0.25]     # Fail if any report got worse
+#   python benchmarks/regression.py --cassette run.zip     # Replay a recorded run instead of using the fake wiki
+import importlib
+import json
+import resource
+import subprocess
+import sys
+from argparse import ArgumentParser, SUPPRESS
+from os import environ, path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from wikitools.fake_wiki import FakeWikiServer, SyntheticWiki
+
+# These reports talk to services other than the wiki, so they can't run offline. They're only run when named explicitly.
+NETWORK_REPORTS = {
+  'external_links2': 'checks domains with Google Safe Browsing and fetches each external link',
+}
+
+METRICS = ['wall', 'cpu', 'requests', 'bytes', 'rss']
+# Differences smaller than these are noise, no matter the percentage
+MIN_DELTA = {'wall': 1, 'cpu': 1, 'requests': 10, 'bytes': 1_000_000, 'rss': 20_000_000}
+
+def run_report(module, output_file):
+  # Runs in a child process, so that peak RSS and CPU time belong to just this report
+  from wikitools import wiki
+  start = perf_counter()
+  w = wiki.Wiki()
+  importlib.import_module(module).main(w)
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  total = w.metrics.snapshot()['total']
+  result = {
+    'wall': perf_counter() - start,
+    'cpu': usage.ru_utime + usage.ru_stime,
+    'requests': total['requests'],
+    'bytes': total['bytes'],
+    'rss': usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024), # macOS reports bytes, Linux reports kilobytes
+  }
+  with open(output_file, 'w') as f:
+    json.dump(result, f)
+
+def measure(module, env, verbose):
+  with TemporaryDirectory() as temp_dir:
+    output_file = path.join(temp_dir, 'result.json')
+    proc = subprocess.run([sys.executable, __file__, '--child', module, output_file], cwd=ROOT, env=env,
+                          stdout=None if verbose else subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if proc.returncode != 0:
+      if not verbose:
+        print(proc.stdout[-2000:])
+      return None
+    with open(output_file) as f:
+      return json.load(f)
+
+def compare(module, baseline, result, threshold):
+  regressions = []
+  for metric in METRICS:
+    old, new = baseline[metric], result[metric]
+    if new - old > MIN_DELTA[metric] and new > old * (1 + threshold):
+      regressions.append(f'{module} {metric} regressed from {old:,.1f} to {new:,.1f} (+{(new / old - 1) if old else float("inf"):.0%})')
+  return regressions
+
+if __name__ == '__main__':
+  parser = ArgumentParser(description='Check reports for end-to-end performance regressions')
+  parser.add_argument('reports', nargs='*', help='Reports to run (default: every report in master.py)')
+  parser.add_argument('--pages', type=int, default=5000, help='Size of the synthetic wiki')
+  parser.add_argument('--latency', type=float, default=0.005, help='Simulated seconds per request')
+  parser.add_argument('--cassette', help='Replay this cassette instead of serving a synthetic wiki (WIKI_API_URL must match the recording)')
+  parser.add_argument('--baseline', default=path.join(path.dirname(__file__), 'baseline.json'))
+  parser.add_argument('--save-baseline', action='store_true')
+  parser.add_argument('--threshold', type=float, default=0.25, help='Allowed fractional increase for each metric')
+  parser.add_argument('--verbose', action='store_true', help='Show report output')
+  parser.add_argument('--child', nargs=2, help=SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    run_report(*args.child)
+    exit(0)
+
+  import master
+  reports = args.reports
+  if not reports:
+    reports = [report for report in master.all_reports if report not in NETWORK_REPORTS]
+    for report, reason in NETWORK_REPORTS.items():
+      print(f'Skipping {report}, which {reason}')
+  env = {**environ, 'PYTHONUNBUFFERED': '1'}
+  env.pop('WIKI_CACHE_DIR', None) # Each report should start cold, like it does in CI
+  server = None
+  if args.cassette:
+    env.setdefault('WIKI_API_URL', 'https://wiki.teamfortress.com/w/api.php')
+    env.update(WIKI_CASSETTE=path.abspath(args.cassette), WIKI_CASSETTE_MODE='replay', WIKI_CASSETTE_LATENCY=str(args.latency))
+  else:
+    server = FakeWikiServer(SyntheticWiki(args.pages), latency=args.latency).start()
+    env['WIKI_API_URL'] = server.api_url
+
+  baseline = {}
+  if path.exists(args.baseline):
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+
+  results = {}
+  regressions = []
+  print(f'{"report":30} {"wall (s)":>10} {"cpu (s)":>10} {"requests":>10} {"MB":>10} {"RSS (MB)":>10}')
+  for report in reports:
+    result = measure(report, env, args.verbose)
+    if not result:
+      print(f'{report:30} failed')
+      if report in baseline:
+        regressions.append(f'{report} failed')
+      continue
+    results[report] = result
+    print(f'{report:30} {result["wall"]:10.1f} {result["cpu"]:10.1f} {result["requests"]:10,} {result["bytes"] / 1e6:10.1f} {result["rss"] / 1e6:10.1f}')
+    if report in baseline:
+      regressions += compare(report, baseline[report], result, args.threshold)
+
+  if server:
+    server.stop()
+
+  if args.save_baseline:
+    with open(args.baseline, 'w') as f:
+      json.dump(baseline | results, f, indent=2, sort_keys=True)
+    print(f'Baseline written to {args.baseline}')
+  elif regressions:
+    print('\n'.join(['', 'Performance regressions:'] + regressions))
+    exit(1)
+  elif baseline:
+    print(f'\nNo regressions beyond {args.threshold:.0%}')
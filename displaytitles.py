@@ -1,9 +1,10 @@
 from re import search
-from utils import pagescraper_queue, time_and_date
+from utils import onlyinclude, pagescraper_queue, report_writer
 from wikitools import wiki
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'en', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'html': ['Main', 'Project', 'File', 'Template', 'Help', 'Category']}
 
 def pagescraper(page, errors, disambig_errors, overflow):
   """
@@ -31,7 +32,8 @@ def pagescraper(page, errors, disambig_errors, overflow):
     overflow[m.group(1)] = page
 
 def page_iter(w):
-  for page in w.get_all_pages(namespaces=['Main', 'Project', 'File', 'Template', 'Help', 'Category']):
+  # Page info includes when each page was last touched, so that unchanged pages' HTML can be reused from the last run.
+  for page in w.crawl(namespaces=['Main', 'Project', 'File', 'Template', 'Help', 'Category'], props=['info']):
     yield page
 
 def main(w):
@@ -48,32 +50,29 @@ def main(w):
   if verbose:
     print(f'Found {num_pages} pages with errors')
 
-  output = """\
-{{{{DISPLAYTITLE: {count} pages with duplicate DISPLAYTITLEs}}}}
-<onlyinclude>{count}</onlyinclude> pages with two (or more) display titles. Data as of {date}.
-
-""".format(
-    count=num_pages,
-    date=time_and_date())
+  report = report_writer()
+  report.header(f'{num_pages} pages with duplicate DISPLAYTITLEs', f'{onlyinclude(num_pages)} pages with two (or more) display titles.')
+  report.write('\n')
 
   if len(overflow) > 0:
-    output += '== Other errors ==\n'
+    report.heading('Other errors')
     for error, page in overflow.items():
-      output += f'=== [[:{page.title}]] ===\n{error}\n'
+      report.heading(f'[[:{page.title}]]', 3)
+      report.write(f'{error}\n')
 
   for language in LANGS:
     if len(errors[language]) + len(disambig_errors[language]) > 0:
-      output += '== {{lang name|name|%s}} ==\n' % language
+      report.lang_heading(language)
 
     if len(errors[language]) > 0:
       for page in sorted(errors[language]):
-        output += f'* [[:{page.title}]]\n'
+        report.item(f'[[:{page.title}]]')
 
     if len(disambig_errors[language]) > 0:
-      output += '=== Disambiguation pages ===\n'
+      report.heading('Disambiguation pages', 3)
       for page in sorted(disambig_errors[language]):
-        output += f'* [[:{page.title}]]\n'
-  return output
+        report.item(f'[[:{page.title}]]')
+  return str(report)
 
 if __name__ == '__main__':
   verbose = True
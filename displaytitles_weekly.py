@@ -8,10 +8,14 @@ def page_iter(w):
   for page in w.get_recent_changes(datetime.utcnow() - timedelta(days=7), namespaces=['Main', 'TFW', 'File', 'Template', 'Help', 'Category']):
     yield page
 
-displaytitles.page_iter = page_iter
-
 def main(w):
-  return displaytitles.main(w)
+  # Only while this report runs, so that the full (monthly) report is unaffected
+  original_page_iter = displaytitles.page_iter
+  displaytitles.page_iter = page_iter
+  try:
+    return displaytitles.main(w)
+  finally:
+    displaytitles.page_iter = original_page_iter
 
 if __name__ == '__main__':
   verbose = True
@@ -90,7 +90,7 @@ def addTopUsers(sortedList, count):
 
   output = ""
   i = 0
-  while i < count:
+  while i < count and i < len(sortedList): # Small wikis may have fewer users than that
     user = sortedList[i]
     username = user['name']
     usereditcount = user['editcount']
@@ -1,11 +1,12 @@
 from os import environ
 from re import compile, VERBOSE
 from time import sleep
-from utils import pagescraper_queue, time_and_date
+from utils import onlyinclude, pagescraper_queue, report_writer
 from wikitools import wiki
 import requests
 
 verbose = False
+NEEDS = {'html': ['Main']}
 
 # Within the HTML source code, all links should be href="()". Internal links start with /wiki/foo, so this will find all external links.
 LINK_REGEX = compile('''
@@ -109,7 +110,7 @@ def main(w):
   all_domains = set()
   all_links = {} # Map of domain: {links}
   with pagescraper_queue(pagescraper, page_links, all_domains, all_links) as pages:
-    for page in w.get_all_pages():
+    for page in w.crawl(props=['info']): # Page info lets get_raw_html skip pages which weren't touched since the last run
       pages.put(page)
 
   total_links = sum(len(links) for links in all_links)
@@ -156,15 +157,11 @@ def main(w):
   if verbose:
     print(f'Finished linkscrapers, found {len(dead_links)} total dead pages')
 
-  output = """\
-{{{{DISPLAYTITLE: {bad_links} broken or dangerous external links}}}}
-<onlyinclude>{bad_links}</onlyinclude> out of {total_links} external links go to broken or dangerous-looking webpages. Data as of {date}.
-
-{{{{TOC limit|3}}}}
-""".format(
-    bad_links=len(dead_links) + len(dangerous_links),
-    total_links=total_links,
-    date=time_and_date())
+  bad_links = len(dead_links) + len(dangerous_links)
+  report = report_writer()
+  report.header(f'{bad_links} broken or dangerous external links',
+    f'{onlyinclude(bad_links)} out of {total_links} external links go to broken or dangerous-looking webpages.')
+  report.write('\n{{TOC limit|3}}\n')
 
   # Avoid rendering images inline
   def link_escape(link):
@@ -177,16 +174,17 @@ def main(w):
       return link.replace('/', '&#47;')
     return link
 
+  sorted_pages = sorted(page_links.keys())
   if len(dangerous_links) > 0:
-    output += '= Dangerous links =\n'
+    report.heading('Dangerous links', 1)
     for dangerous_link in sorted(dangerous_links.keys(), key=lambda link:dangerous_links[link]):
-      output += f'== {link_escape(dangerous_link)}: {dangerous_links[dangerous_link]} ==\n'
-      for page in sorted(page_links.keys()):
+      report.heading(f'{link_escape(dangerous_link)}: {dangerous_links[dangerous_link]}')
+      for page in sorted_pages:
         if dangerous_link in page_links[page]:
-          output += f'* [[:{page.title}]]\n'
+          report.item(f'[[:{page.title}]]')
 
   if len(dead_links) > 0:
-    output += '= Broken links =\n'
+    report.heading('Broken links', 1)
 
     # Alphabetize the hostnames
     def sort_key(domain):
@@ -202,15 +200,15 @@ def main(w):
         total_page_links = 0
         for link in dead_domain_links:
           total_page_links += sum(1 for links in page_links.values() if link in links)
-        output += f'== {domain} ({total_page_links} links) ==\n'
+        report.heading(f'{domain} ({total_page_links} links)')
 
         for link in sorted(dead_domain_links):
-          output += f'=== {link_escape(link)}: {dead_links[link]} ===\n'
-          for page in sorted(page_links.keys()):
+          report.heading(f'{link_escape(link)}: {dead_links[link]}', 3)
+          for page in sorted_pages:
             if link in page_links[page]:
-              output += f'* [[:{page.title}]]\n'
+              report.item(f'[[:{page.title}]]')
 
-  return output
+  return str(report)
 
 if __name__ == '__main__':
   verbose = True
@@ -1,4 +1,4 @@
-from utils import pagescraper_queue, time_and_date
+from utils import time_and_date
 from wikitools import wiki
 from wikitools.page import Page
 
@@ -7,12 +7,13 @@ LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl',
 NAMESPACES = ['Main', 'Project', 'Help', 'Category']
 
 def pagescraper(page, english_redirects, lang_redirects, bad_redirects):
-  link = next(page.get_links(namespaces=NAMESPACES), None)
-  if not link:
+  links = page.raw.get('links', [])
+  if not links:
     if verbose:
       print(f'{page.title} redirects to a page outside of NAMESPACES, ignoring')
     return
 
+  link = Page(page.wiki, links[0]['title'])
   if page.lang == 'en':
     english_redirects[page.title] = link
   elif page.lang != link.lang:
@@ -24,9 +25,10 @@ def main(w):
   english_redirects = {}
   lang_redirects = {language: {} for language in LANGS}
   bad_redirects = {language: {} for language in LANGS}
-  with pagescraper_queue(pagescraper, english_redirects, lang_redirects, bad_redirects) as pages:
-    for page in w.get_all_pages(namespaces=NAMESPACES, redirects=True):
-      pages.put(page)
+  # Crawl all redirects along with their targets, rather than making a request per redirect
+  link_namespaces = '|'.join(str(w.namespaces[namespace]) for namespace in NAMESPACES)
+  for page in w.crawl(namespaces=NAMESPACES, redirects=True, props=['links'], plnamespace=link_namespaces):
+    pagescraper(page, english_redirects, lang_redirects, bad_redirects)
 
   incorrect_redirects = {language: set() for language in LANGS}
   for language in LANGS:
@@ -1,12 +1,15 @@
-from utils import pagescraper_queue, time_and_date
+from utils import time_and_date
 from wikitools import wiki
+from wikitools.page import Page
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'en', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'links': ['Main']}
 
 def pagescraper(page, mislinked):
   links = []
-  for link in page.get_links():
+  for entry in page.raw.get('links', []):
+    link = Page(page.wiki, entry['title'])
     if page.basename == 'Localization files' and link.basename == 'Winger':
       continue # Used as a cross-language example for localization files
     elif page.basename == 'Spy' and link.basename in ['Spy responses', 'Spy voice commands']:
@@ -23,11 +26,11 @@ def pagescraper(page, mislinked):
 
 def main(w):
   mislinked = {lang: [] for lang in LANGS}
-  with pagescraper_queue(pagescraper, mislinked) as pages:
-    for page in w.get_all_pages():
-      if page.basename in ['Main Page', 'Main Page (Classic)']:
-        continue # Main Page links to all other main pages
-      pages.put(page)
+  # Crawl all pages along with their links, rather than making a request per page
+  for page in w.crawl(props=['links'], plnamespace=w.namespaces['Main']):
+    if page.basename in ['Main Page', 'Main Page (Classic)']:
+      continue # Main Page links to all other main pages
+    pagescraper(page, mislinked)
 
   page_count = sum(len(pages) for pages in mislinked.values())
   output = f"""\
@@ -1,12 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import datetime, timedelta
 import importlib
 from os import environ
 from random import shuffle
+from re import fullmatch
 from subprocess import check_output
 from sys import stdout
 from traceback import print_exc
+from utils import pagescraper_queue, split_report
 from wikitools import wiki
 from wikitools.page import Page
+from wikitools.profiler import Profiler
+from wikitools.tracing import tracer
 
 import open_pr_comment
 
@@ -32,12 +38,50 @@ import open_pr_comment
 # Ensure that PRs which add files also touch readme.md -> isn't this done?
 # Templates which link to redirects
 
+# Reports bigger than this are split into subpages (Report/Part 1, Report/Part 2, ...) and an index page,
+# since huge edits are slow to save and render (and Page.edit truncates anything over 3 MB).
+MAX_PAGE_SIZE = 1_000_000 # bytes
+
+def paginate(page_name, output):
+  if len(output.encode('utf-8')) <= MAX_PAGE_SIZE:
+    return {page_name: output}
+
+  preamble, parts = split_report(output, MAX_PAGE_SIZE)
+  index = preamble.rstrip('\n') + f'\n\nThis report is split into {len(parts)} parts:\n'
+  pages = {}
+  for i, part in enumerate(parts, 1):
+    index += f'* [[{page_name}/Part {i}|Part {i}]]'
+    if part.startswith('='):
+      first_heading = part.partition('\n')[0].strip('= ')
+      index += f' (from {first_heading})'
+    index += '\n'
+    pages[f'{page_name}/Part {i}'] = f"''Part {i} of {len(parts)} of [[{page_name}]].''\n" + part
+  pages[page_name] = index
+  return pages
+
+def remove_stale_parts(page_name, num_parts, summary):
+  # Parts from an earlier (bigger) run would otherwise be left behind with outdated data
+  for subpage in Page(w, page_name).get_subpages():
+    m = fullmatch('Part ([0-9]+)', subpage.title.rpartition('/')[2])
+    if m and int(m[1]) > num_parts:
+      if not subpage.delete(f'Report no longer has this many parts. {summary}'):
+        subpage.edit(f"''This part of [[{page_name}]] is no longer used.''", bot=True, summary=summary)
+
 def edit_or_save(page_name, file_name, output, summary):
-  wiki_diff_url = Page(w, page_name).edit(output, bot=True, summary=summary)
-  if wiki_diff_url:
-    return wiki_diff_url
+  pages = paginate(page_name, output)
+  # Publish all parts at once. Each thread runs in a copy of our context, so its requests count towards this report.
+  with ThreadPoolExecutor(max_workers=4) as executor:
+    edits = {name: executor.submit(copy_context().run, Page(w, name).edit, text, bot=True, summary=summary) for name, text in pages.items()}
+  diff_urls = {name: edit.result() for name, edit in edits.items()}
+
+  # The report is only published if every part of it was, otherwise the parts which failed would be lost.
+  if all(diff_urls.values()):
+    remove_stale_parts(page_name, len(pages) - 1, summary)
+    return diff_urls[page_name]
 
   # Edit failed, fall back to saving to file (will be attached as a build artifact)
+  failed = [name for name, url in diff_urls.items() if not url]
+  print(f'Failed to publish {", ".join(failed)}, saving {page_name} to {file_name}')
   with open(file_name, 'w', encoding='utf-8') as f:
     f.write(output)
 
@@ -45,9 +89,11 @@ def edit_or_save(page_name, file_name, output, summary):
 
 def publish_report(w, module, report_name, root, summary):
   link_map = {}
-  report_file_name = 'wiki_' + report_name.lower().replace(' ', '_')
+  report_file_name = 'wiki_' + report_name.lower().replace(' ', '_').replace('/', '_') # e.g. Missing translations/sorted
   try:
-    report_output = importlib.import_module(module).main(w)
+    # e.g. WIKI_PROFILE=cpu,memory to write wiki_<module>_profile.pstats, .collapsed and _allocations.log
+    with Profiler(f'wiki_{module}_profile', environ.get('WIKI_PROFILE')), tracer.span(module, 'report'):
+      report_output = importlib.import_module(module).main(w)
 
     if isinstance(report_output, list):
       shuffle(report_output) # Shuffle the order so that we don't always upload the same language first, to ensure even coverage of 502s
@@ -97,6 +143,77 @@ monthly_reports = {
 
 all_reports = daily_reports | weekly_reports | monthly_reports
 
+def run_report(w, module, root, summary):
+  report_name = all_reports[module]
+  start = datetime.now()
+  print(f'Starting {report_name} at {start}')
+  with w.metrics.scope(module):
+    link_map = publish_report(w, module, report_name, root, summary)
+  duration = datetime.now() - start
+  duration -= timedelta(microseconds=duration.microseconds) # Strip microseconds
+  request_summary = w.metrics.summary(module)
+  print(f'Finished {report_name} in {duration} ({request_summary})')
+  return link_map, duration, request_summary
+
+# Reports declare the data they read as NEEDS, e.g. {'wikitext': ['Template']} (see Wiki.prefetch).
+# Reports which read page contents or HTML run first, right after that data is loaded, and cheaper reports run later.
+NEEDS_ORDER = ['wikitext', 'html', 'links', 'categories', 'titles']
+
+def get_needs(module):
+  return getattr(importlib.import_module(module), 'NEEDS', {})
+
+def order_reports(modules):
+  def first_need(module):
+    needs = get_needs(module)
+    return min((NEEDS_ORDER.index(need) for need in needs if needs[need]), default=len(NEEDS_ORDER))
+  return sorted(modules, key=first_need) # Stable, so reports with the same needs keep their order
+
+def prefetch(w, modules):
+  # Load everything the reports need in one pass per kind of data, instead of each report loading its own (overlapping) pages.
+  needs = {}
+  for module in modules:
+    for need, namespaces in get_needs(module).items():
+      needs.setdefault(need, set()).update(namespaces)
+  if not needs:
+    return
+
+  start = datetime.now()
+  try:
+    with w.metrics.scope('prefetch'), tracer.span('prefetch', 'report'):
+      html_pages = w.prefetch(needs)
+      with pagescraper_queue(lambda page: page.get_raw_html()) as pages:
+        for page in html_pages:
+          pages.put(page)
+  except Exception:
+    print('Failed to prefetch, reports will load their own data') # Which is slower, but otherwise harmless
+    print_exc(file=stdout)
+  duration = datetime.now() - start
+  duration -= timedelta(microseconds=duration.microseconds) # Strip microseconds
+  print(f'Prefetched {", ".join(sorted(needs))} in {duration} ({w.metrics.summary("prefetch")})')
+
+def run_reports(w, modules, root, summary, parallelism=1):
+  # Returns {module: (link_map, duration, request_summary)}
+  if parallelism <= 1:
+    return {module: run_report(w, module, root, summary) for module in modules}
+
+  # Reports mostly wait on the network, so several can run at once. They share w, and so its caches, its connection
+  # pool, and the governor's limit on requests in flight (which is the budget for the whole run, not per report).
+  # The _weekly variants modify their base report's module (e.g. replacing mismatched.page_iter),
+  # so each variant runs in the same worker as its base report, one after the other.
+  groups = {}
+  for module in modules:
+    groups.setdefault(module.removesuffix('_weekly'), []).append(module)
+
+  def run_group(group):
+    return [(module, run_report(w, module, root, summary)) for module in group]
+
+  with ThreadPoolExecutor(max_workers=parallelism) as executor:
+    futures = [executor.submit(copy_context().run, run_group, group) for group in groups.values()]
+  results = {}
+  for future in futures:
+    results.update(future.result())
+  return results
+
 if __name__ == '__main__':
   event = environ.get('GITHUB_EVENT_NAME', 'local_run')
   modules_to_run = []
@@ -146,7 +263,7 @@ if __name__ == '__main__':
     modules_to_run = all_reports.keys() # On manual triggers, run everything
 
   elif event == 'local_run':
-    w = wiki.Wiki()
+    w = wiki.Wiki(memoize_lists=True)
     for report in all_reports:
       # Root and summary don't matter because we can't publish anyways.
       print(report)
@@ -158,26 +275,32 @@ if __name__ == '__main__':
     print(f'Not sure what to run in response to {event}')
     exit(1)
 
-  w = wiki.Wiki()
+  # Most reports enumerate the same page lists, so share them across the run.
+  w = wiki.Wiki(memoize_lists=True)
   if not w.login(environ['WIKI_USERNAME'], environ['WIKI_PASSWORD']):
     exit(1)
 
+  # e.g. WIKI_PARALLEL_REPORTS=4 to run up to 4 reports at once
+  parallelism = int(environ.get('WIKI_PARALLEL_REPORTS', 1))
+  if parallelism > 1 and environ.get('WIKI_PROFILE'):
+    print('Profiles would include every report running at once, so running reports one at a time')
+    parallelism = 1
+  run_order = order_reports(modules_to_run)
+  prefetch(w, run_order)
+  results = run_reports(w, run_order, root, summary, parallelism)
+
   comment = 'Please verify the following diffs:\n'
   succeeded = True
 
   for module in modules_to_run:
     report_name = all_reports[module]
-    start = datetime.now()
-    print(f'Starting {report_name} at {start}')
-    link_map = publish_report(w, module, report_name, root, summary)
-    duration = datetime.now() - start
-    duration -= timedelta(microseconds=duration.microseconds) # Strip microseconds
+    link_map, duration, request_summary = results[module]
     if not link_map:
       action_url = 'https://github.com/' + environ['GITHUB_REPOSITORY'] + '/actions/runs/' + environ['GITHUB_RUN_ID']
-      comment += f'- [ ] {report_name} failed after {duration}: {action_url}\n'
+      comment += f'- [ ] {report_name} failed after {duration} ({request_summary}): {action_url}\n'
       succeeded = False
     else:
-      comment += f'- [ ] {report_name} succeeded in {duration}:'
+      comment += f'- [ ] {report_name} succeeded in {duration} ({request_summary}):'
       languages = sorted(link_map.keys(), key=lambda lang: (lang != 'en', lang)) # Sort languages, keeping english first
       for language in languages:
         link = link_map.get(language, None)
@@ -187,6 +310,10 @@ if __name__ == '__main__':
           comment += f' ~~[{language}](## "Upload failed")~~'
       comment += '\n'
 
+  w.metrics.dump('wiki_metrics.json') # Per-endpoint and per-report request statistics, uploaded as an artifact
+  print(f'Text cache: {w.page_text_cache.stats()}')
+  print(f'HTML cache: {w.page_html_cache.stats()}')
+
   if event == 'pull_request':
     open_pr_comment.create_pr_comment(comment)
   elif event == 'workflow_dispatch':
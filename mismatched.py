@@ -1,7 +1,7 @@
 # coding: utf-8
 from re import compile, IGNORECASE
 from unicodedata import east_asian_width as width
-from utils import pagescraper_queue, time_and_date
+from utils import onlyinclude, pagescraper_queue, report_writer
 from wikitools import wiki
 
 pairs = [
@@ -64,6 +64,7 @@ exemptions = [
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'en', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'wikitext': ['Main', 'File', 'Template', 'Help', 'Category']}
 
 
 def pagescraper(page, translation_data):
@@ -160,7 +161,7 @@ def pagescraper(page, translation_data):
     translation_data[page.lang].append(data)
 
 def page_iter(w):
-  for page in w.get_all_pages(namespaces=['Main', 'File', 'Template', 'Help', 'Category']):
+  for page in w.get_all_pages(namespaces=['Main', 'File', 'Template', 'Help', 'Category'], with_text=True):
     yield page
 
 def main(w):
@@ -188,22 +189,18 @@ def main(w):
       if page.title.startswith('Template:Dictionary/steam ids'):
         continue # Usernames can be literally anything, and thus have no "matching" requirements
       pages.put(page)
-  output = """\
-{{{{DISPLAYTITLE: {count} pages with mismatched parenthesis}}}}
-<onlyinclude>{count}</onlyinclude> pages with mismatched <nowiki>(), [], and {{}}</nowiki>. Data as of {date}.
-{{{{TOC limit|2}}}}
-
-""".format(
-    count=sum(len(lang_pages) for lang_pages in translation_data.values()),
-    date=time_and_date())
+  count = sum(len(lang_pages) for lang_pages in translation_data.values())
+  report = report_writer()
+  report.header(f'{count} pages with mismatched parenthesis', f'{onlyinclude(count)} pages with mismatched <nowiki>(), [], and {{}}</nowiki>.')
+  report.write('{{TOC limit|2}}\n\n')
 
   for language in LANGS:
     if len(translation_data[language]) > 0:
-      output += '== {{lang name|name|%s}} ==\n' % language
+      report.lang_heading(language)
       for data in translation_data[language]:
-        output += data
+        report.write(data)
 
-  return output
+  return str(report)
 
 if __name__ == '__main__':
   verbose = True
@@ -5,13 +5,19 @@ import mismatched
 
 # We are overwriting page_iter so that the weekly report can just process the past week of changes.
 def page_iter(w):
-  for page in w.get_recent_changes(datetime.utcnow() - timedelta(days=7), namespaces=['Main', 'File', 'Template', 'Help', 'Category']):
+  pages = list(w.get_recent_changes(datetime.utcnow() - timedelta(days=7), namespaces=['Main', 'File', 'Template', 'Help', 'Category']))
+  w.prefetch_text(pages)
+  for page in pages:
     yield page
 
-mismatched.page_iter = page_iter
-
 def main(w):
-  return mismatched.main(w)
+  # Only while this report runs, so that the full (monthly) report is unaffected
+  original_page_iter = mismatched.page_iter
+  mismatched.page_iter = page_iter
+  try:
+    return mismatched.main(w)
+  finally:
+    mismatched.page_iter = original_page_iter
 
 if __name__ == '__main__':
   verbose = True
@@ -3,13 +3,18 @@ from wikitools import wiki
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'titles': ['Main']}
 sort_by_count = False
 
 
 def main(w):
   all_pages = {lang:set() for lang in LANGS}
   english_pages = set()
-  for page in w.get_all_pages():
+  if sort_by_count:
+    pages = w.crawl(props=['links'], plnamespace=w.namespaces['Main']) # Includes each page's links, for sorting
+  else:
+    pages = w.get_all_pages()
+  for page in pages:
     if page.lang != 'en':
       all_pages[page.lang].add(page.basename)
     elif 'OTFWH' in page.title: # ETF2L Highlander Community Challenge/OTFWH
@@ -23,7 +28,7 @@ def main(w):
     print(f'Done processing pages, found {len(english_pages)} english pages')
 
   if sort_by_count:
-    link_counts = {page.title: sum(1 for _ in page.get_links()) for page in english_pages}
+    link_counts = {page.title: len(page.raw.get('links', [])) for page in english_pages}
     sort_key = lambda page: -link_counts[page.basename]
   else:
     sort_key = lambda page: page.title
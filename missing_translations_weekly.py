@@ -2,11 +2,15 @@ from wikitools import wiki
 
 import missing_translations
 
-# Flipping the 'sort_by_count' flag to, well, sort by count
-missing_translations.sort_by_count = True
+NEEDS = {'links': ['Main']}
 
 def main(w):
-  return missing_translations.main(w)
+  # Flipping the 'sort_by_count' flag to, well, sort by count (only while this report runs, so the daily report is unaffected)
+  missing_translations.sort_by_count = True
+  try:
+    return missing_translations.main(w)
+  finally:
+    missing_translations.sort_by_count = False
 
 if __name__ == '__main__':
   verbose = True
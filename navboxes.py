@@ -1,9 +1,10 @@
-from utils import pagescraper_queue, time_and_date
+from utils import onlyinclude, pagescraper_queue, report_writer
 from wikitools import wiki
 from wikitools.page import Page
 
 verbose = False
 NAMESPACES = ['Main', 'Project', 'Help', 'File', 'Template']
+NEEDS = {'titles': NAMESPACES, 'wikitext': ['Template'], 'links': ['Template']}
 
 excluded_templates = [
   # The class hat tables aren't really navboxes, even though they call {{Navbox}}
@@ -61,14 +62,13 @@ excluded_pages = {
 }
 
 
-def pagescraper(navbox, navbox_templates):
-  links = []
+def pagescraper(navbox, navbox_links, navbox_templates):
+  links = navbox_links.get(navbox.title, [])
   transclusions = []
   for namespace in NAMESPACES:
-    links.extend(navbox.get_links(namespaces=[namespace]))
     transclusions.extend(navbox.get_transclusions(namespaces=[namespace]))
   navbox_templates[navbox.title] = [
-    set(link.title for link in links),
+    set(link['title'] for link in links),
     set(trans.title for trans in transclusions),
   ]
   if verbose:
@@ -76,10 +76,14 @@ def pagescraper(navbox, navbox_templates):
 
 def main(w):
   navbox_templates = {}
-  template_navbox = Page(w, 'Template:Navbox')
-
-  with pagescraper_queue(pagescraper, navbox_templates) as navboxes:
-    for page in template_navbox.get_transclusions(namespaces=['Template']):
+  navbox_transclusions = list(Page(w, 'Template:Navbox').get_transclusions(namespaces=['Template']))
+  w.prefetch_text(navbox_transclusions)
+  # Every template's links, from one crawl of the template namespace instead of a query per navbox and namespace
+  link_namespaces = '|'.join(str(w.namespaces[namespace]) for namespace in NAMESPACES)
+  navbox_links = {page.title: page.raw.get('links', []) for page in w.crawl(namespaces=['Template'], props=['links'], plnamespace=link_namespaces)}
+
+  with pagescraper_queue(pagescraper, navbox_links, navbox_templates) as navboxes:
+    for page in navbox_transclusions:
       if page.title.lower().startswith('template:navbox'):
         continue # Exclude alternative navbox templates
       if page.title.lower().endswith('sandbox'):
@@ -98,7 +102,7 @@ def main(w):
   extra_navboxes = {template: [] for template in navbox_templates}
   count = 0
   count2 = 0
-  for page in w.get_all_pages(namespaces=NAMESPACES):
+  for page in w.get_all_pages(namespaces=NAMESPACES, keep_raw=False):
     expected_navboxes = 0
     page_missing_navboxes = []
     page_extra_navboxes = []
@@ -136,35 +140,30 @@ def main(w):
       for template in page_extra_navboxes:
         extra_navboxes[template].append(page)
 
-  output = """\
-{{{{DISPLAYTITLE:{total_count} pages missing navbox templates}}}}
-There are <onlyinclude>{total_count}</onlyinclude> pages which have too many / too few navboxes. {count} pages are short on navboxes; {count2} pages have too many. Data as of {date}.
-
-""".format(
-      total_count=count+count2,
-      count=count,
-      count2=count2,
-      date=time_and_date())
+  report = report_writer()
+  report.header(f'{count+count2} pages missing navbox templates',
+    f'There are {onlyinclude(count+count2)} pages which have too many / too few navboxes. {count} pages are short on navboxes; {count2} pages have too many.')
+  report.write('\n')
 
-  output += '== Missing navboxes ==\n'
+  report.heading('Missing navboxes')
   for template in sorted(missing_navboxes.keys()):
     if len(missing_navboxes[template]) == 0:
       continue
 
-    output += '=== {{tl|%s}} (%d) ===\n' % (template.replace('Template:', ''), len(missing_navboxes[template]))
+    report.heading('{{tl|%s}} (%d)' % (template.replace('Template:', ''), len(missing_navboxes[template])), 3)
     for page in sorted(missing_navboxes[template]):
-      output += f'* [{page.get_edit_url()} {page.title}] does not transclude {template}\n'
+      report.item(f'[{page.get_edit_url()} {page.title}] does not transclude {template}')
 
-  output += '== Extraneous navboxes ==\n'
+  report.heading('Extraneous navboxes')
   for template in sorted(extra_navboxes.keys()):
     if len(extra_navboxes[template]) == 0:
       continue
 
-    output += '=== {{tl|%s}} (%d) ===\n' % (template.replace('Template:', ''), len(extra_navboxes[template]))
+    report.heading('{{tl|%s}} (%d)' % (template.replace('Template:', ''), len(extra_navboxes[template])), 3)
     for page in sorted(extra_navboxes[template]):
-      output += f'* [{page.get_edit_url()} {page.title}] is not linked from {template}\n'
+      report.item(f'[{page.get_edit_url()} {page.title}] is not linked from {template}')
 
-  return output
+  return str(report)
 
 if __name__ == '__main__':
   verbose = True
@@ -3,6 +3,7 @@ from wikitools import wiki
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'titles': ['Main', 'Help', 'Category']}
 
 def main(w):
   # Some english pages were merged together into one, larger page since they were very repetitive.
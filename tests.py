@@ -1,6 +1,60 @@
 # A very light smattering of tests
 import inspect
 import sys
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+import all_articles
+import incorrectly_linked
+import wanted_templates
+from utils import onlyinclude, plural, report_writer, split_report
+
+from wikitools import wiki
+from wikitools.cassette import Cassette, CassetteMiss
+from wikitools.compressed_dict import CompressedDict
+from wikitools.dump_wiki import DumpWiki
+from wikitools.fake_wiki import FakeWikiServer, SyntheticWiki
+from wikitools.page import Page
+from wikitools.text_cache import TextCache
+
+DUMP = '''\
+<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" version="0.11">
+  <siteinfo>
+    <namespaces>
+      <namespace key="0" case="first-letter" />
+      <namespace key="6" case="first-letter">File</namespace>
+      <namespace key="10" case="first-letter">Template</namespace>
+      <namespace key="12" case="first-letter">Help</namespace>
+      <namespace key="14" case="first-letter">Category</namespace>
+    </namespaces>
+  </siteinfo>
+  <page>
+    <title>Scout</title>
+    <ns>0</ns>
+    <id>1</id>
+    <revision><id>11</id><text xml:space="preserve">{{Class infobox|name=Scout}} {{{1}}} {{DISPLAYTITLE:Scout}} {{lang|en=Scout}}</text></revision>
+  </page>
+  <page>
+    <title>Scout/fr</title>
+    <ns>0</ns>
+    <id>2</id>
+    <revision><id>12</id><text xml:space="preserve">{{class infobox}}</text></revision>
+  </page>
+  <page>
+    <title>Scouts</title>
+    <ns>0</ns>
+    <id>3</id>
+    <redirect title="Scout" />
+    <revision><id>13</id><text xml:space="preserve">#REDIRECT [[Scout]]</text></revision>
+  </page>
+  <page>
+    <title>Template:Class infobox</title>
+    <ns>10</ns>
+    <id>4</id>
+    <revision><id>14</id><text xml:space="preserve">{{{name}}}</text></revision>
+  </page>
+</mediawiki>
+'''
 
 class Tests:
   # Class setup
@@ -9,9 +63,243 @@ class Tests:
   #!# Tests #!#
   #############
 
-  # TODO: Define tests here (which start with the word test)
-  def test_nothing(self):
-    pass
+  def test_dump_wiki(self):
+    with TemporaryDirectory() as temp_dir:
+      with open(f'{temp_dir}/dump.xml', 'w', encoding='utf-8') as f:
+        f.write(DUMP)
+      w = DumpWiki(f.name)
+      assert len(w.page_text_cache.memory) == 0, 'Page contents should only be on disk'
+
+      pages = list(w.get_all_pages())
+      assert [page.title for page in pages] == ['Scout', 'Scout/fr'], pages
+      assert [page.title for page in w.get_all_pages(redirects=True)] == ['Scouts']
+      assert [page.title for page in w.get_all_templates()] == ['Template:Class infobox']
+      assert pages[1].get_wiki_text() == '{{class infobox}}'
+
+      template = next(w.get_all_templates())
+      transclusions = [page.title for page in template.get_transclusions()]
+      assert transclusions == ['Scout', 'Scout/fr'], transclusions
+      assert template.get_transclusions(namespaces=['Template']) is not None
+      assert sum(1 for _ in template.get_transclusions(namespaces=['Template'])) == 0
+
+      # Reports call the same page APIs on a dump as on the live wiki
+      outputs = dict(all_articles.main(w))
+      assert '[[:Scout]]' in outputs['en'] and '[[:Scout/fr]]' in outputs['fr'], outputs['en']
+
+  def test_compressed_dict(self):
+    compressed_dict = CompressedDict(train_after=4)
+    skin = ''.join(f'<li><a href="/wiki/Page_{i}">Page {i}</a></li>\n' for i in range(500))
+    pages = {f'Page {i}': f'<html>\n{skin}<p>Contents of page {i}</p>\n{skin}</html>' for i in range(20)}
+    for title, html in pages.items():
+      compressed_dict[title] = html
+    assert compressed_dict.zdict, 'Expected a dictionary to be trained'
+    assert all(compressed_dict[title] == html for title, html in pages.items())
+    assert compressed_dict.compressed_bytes < compressed_dict.raw_bytes / 20, (compressed_dict.compressed_bytes, compressed_dict.raw_bytes)
+
+    compressed_dict['Page 0'] = 'Overwritten'
+    assert compressed_dict['Page 0'] == 'Overwritten'
+    del compressed_dict['Page 1']
+    compressed_dict.discard('Page 1')
+    assert 'Page 1' not in compressed_dict and compressed_dict.get('Page 1') is None
+    assert len(compressed_dict) == 19
+
+  def test_cache_eviction(self):
+    text_cache = TextCache(memory_budget=10_000)
+    compressed_dict = CompressedDict(shards=2, memory_budget=2_000)
+    pages = {f'Page {i}': f'Contents of page {i} ' * 100 for i in range(50)}
+    for title, text in pages.items():
+      text_cache.set(title, text, 1)
+      compressed_dict[title] = text + str(hash(title)) * 50
+    assert text_cache.memory_size <= 10_000 and text_cache.evictions > 0, text_cache.stats()
+    assert compressed_dict.compressed_bytes <= 2_000 and compressed_dict.stats()['evictions'] > 0, compressed_dict.stats()
+    assert len(text_cache) == len(compressed_dict) == 50
+    # Checking for a page neither loads it nor makes it recently used
+    order, stats = list(text_cache.memory), text_cache.stats()
+    assert all(title in text_cache for title in pages) and 'Page 50' not in text_cache
+    assert list(text_cache.memory) == order and text_cache.stats() == stats
+    # Evicted entries come back from disk
+    assert all(text_cache.get(title, revid=1) == text for title, text in pages.items())
+    assert all(compressed_dict[title].startswith(text) for title, text in pages.items())
+    assert text_cache.stats()['disk_hits'] > 0 and compressed_dict.stats()['disk_hits'] > 0
+    text_cache.discard('Page 0')
+    del compressed_dict['Page 0']
+    assert 'Page 0' not in text_cache and 'Page 0' not in compressed_dict
+    assert len(text_cache) == len(compressed_dict) == 49
+
+  def test_fake_wiki(self):
+    synthetic_wiki = SyntheticWiki(500)
+    with FakeWikiServer(synthetic_wiki) as server:
+      w = wiki.Wiki(server.api_url)
+      pages = list(w.get_all_pages())
+      assert len(pages) == len([title for title in synthetic_wiki.titles[0] if not synthetic_wiki.is_redirect(title)])
+      assert pages[0].get_wiki_text() == synthetic_wiki.text(pages[0].title)
+
+      template = next(w.get_all_templates())
+      transclusions = [page.title for page in template.get_transclusions()]
+      assert transclusions == synthetic_wiki.embeddedin(template.title), transclusions
+
+      assert 'pages link' in incorrectly_linked.main(w)
+
+  def test_async_wiki(self):
+    synthetic_wiki = SyntheticWiki(500)
+    with FakeWikiServer(synthetic_wiki) as server:
+      w = wiki.Wiki(server.api_url)
+      expected = {template: len(list(Page(w, template).get_transclusions(namespaces=wanted_templates.NAMESPACES))) for template in w.get_all_wanted_templates()}
+    with FakeWikiServer(synthetic_wiki, error_rate=0.3) as server:
+      w = wiki.Wiki(server.api_url)
+      w.governor.min_backoff = 0 # Still retried, but without waiting
+      request_count = server.request_count
+      with w.metrics.scope('wanted_templates'):
+        wanted = wanted_templates.main(w)
+      # Async requests are governed and counted like any other, including the retries of failed ones
+      total = w.metrics.snapshot('wanted_templates')['total']
+      assert total['requests'] == server.request_count - request_count and total['retries'] > 0, total
+      assert w.governor.in_flight == 0
+    for template, count in expected.items():
+      assert (f'{template} has {plural.uses(count)}' in wanted) == (count > 0), template
+    assert any(expected.values())
+
+  def test_single_flight(self):
+    synthetic_wiki = SyntheticWiki(100)
+    with FakeWikiServer(synthetic_wiki, latency=0.2) as server:
+      w = wiki.Wiki(server.api_url)
+      page = next(w.get_all_pages())
+      request_count = server.request_count
+      results = []
+      threads = [Thread(target=lambda: results.append((page.get_wiki_text(), page.get_raw_html()))) for _ in range(10)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      assert results == [(synthetic_wiki.text(page.title), synthetic_wiki.html(page.title))] * 10
+      assert server.request_count == request_count + 2, server.request_count - request_count
+      assert w.transport.single_flight.shared > 0
+
+  def test_prefetch(self):
+    synthetic_wiki = SyntheticWiki(200)
+    with FakeWikiServer(synthetic_wiki) as server:
+      w = wiki.Wiki(server.api_url, memoize_lists=True)
+      w.prefetch({'titles': {'Main'}, 'links': {'Main'}, 'wikitext': {'Template'}, 'categories': {'Main'}})
+      request_count = server.request_count
+      pages = list(w.get_all_pages())
+      members = {category.title: sorted(page.title for page in w.get_all_category_pages(category.title)) for category in w.get_all_categories(filter_redirects=False)}
+      linked_pages = list(w.crawl(props=['links'], plnamespace=w.namespaces['Main']))
+      templates = list(w.get_all_templates(with_text=True))
+      assert [page.get_wiki_text() for page in templates] == [synthetic_wiki.text(page.title) for page in templates]
+      assert server.request_count == request_count, server.request_count - request_count
+      assert len(pages) == len(linked_pages) and len(templates) > 0
+      # Links to the main namespace are filtered from the prefetched links to every namespace
+      direct_links = {page.title: page.raw.get('links', []) for page in wiki.Wiki(server.api_url).crawl(props=['links'], plnamespace=w.namespaces['Main'])}
+      assert {page.title: page.raw.get('links', []) for page in linked_pages} == direct_links
+      # Category members come from one crawl, rather than a list per category
+      assert members == {category: sorted(title for title in synthetic_wiki.members(category) if synthetic_wiki.namespace(title) == 0) for category in members} and any(members.values())
+
+  def test_html_store(self):
+    synthetic_wiki = SyntheticWiki(200)
+    with TemporaryDirectory() as temp_dir, FakeWikiServer(synthetic_wiki) as server:
+      def load_html():
+        w = wiki.Wiki(server.api_url, cache_dir=temp_dir)
+        request_count = server.request_count
+        html = {page.title: page.get_raw_html() for page in w.crawl(props=['info'])}
+        return w, html, server.request_count - request_count
+
+      _, html, first_requests = load_html()
+      assert all(html[title] == synthetic_wiki.html(title) for title in html)
+      # Pages which haven't been touched since are reused without asking the server
+      synthetic_wiki.edit(next(iter(html)), 'Edited')
+      w, html, second_requests = load_html()
+      assert second_requests == first_requests - len(html) + 1, (first_requests, second_requests)
+      assert html[next(iter(html))] == synthetic_wiki.html(next(iter(html)))
+      # Without page info, the stored HTML is revalidated
+      bytes_sent = server.bytes_sent
+      page = wiki.Page(w, list(html)[1])
+      w.page_html_cache.clear()
+      assert page.get_raw_html() == html[page.title]
+      assert server.bytes_sent == bytes_sent, 'Expected a 304 response'
+
+  def test_edit(self):
+    synthetic_wiki = SyntheticWiki(100)
+    with FakeWikiServer(synthetic_wiki) as server:
+      w = wiki.Wiki(server.api_url)
+      w.login('Bot', 'pw')
+      page = wiki.Page(w, 'User:Bot/Reports/Test')
+      report = '{{DISPLAYTITLE: Test}}\nData as of 12:00, 01 October 2026 (GMT).\n== A ==\n* [[:Scout]]\n'
+      assert page.edit(report, 'test')
+      # Unchanged reports cost one request, even though they were generated later
+      request_count = server.request_count
+      assert page.edit(report.replace('12:00', '13:00'), 'test').endswith('?oldid=' + str(synthetic_wiki.revid(page.title)))
+      assert server.request_count == request_count + 1
+      assert 'Data as of 12:00' in synthetic_wiki.text(page.title)
+      # The CSRF token is reused until it's rejected
+      server.api.csrf_token = 'newcsrf+\\'
+      request_count = server.request_count
+      assert page.edit(report + '* [[:Spy]]\n', 'test')
+      assert server.request_count == request_count + 4 # Check for changes, edit (rejected), new token, edit
+      assert page.edit(report, 'test') and server.request_count == request_count + 6
+
+  def test_report_writer(self):
+    report = report_writer()
+    report.header('2 pages with errors', f'{onlyinclude(2)} pages have errors.')
+    report.lang_heading('fr')
+    report.item('[[:Scout/fr]]')
+    report.item('[[:Espion/fr]]', '#')
+    report.item('[[:Éclaireur/fr]]', '#')
+    output = str(report)
+    assert output.startswith('{{DISPLAYTITLE: 2 pages with errors}}\n<onlyinclude>2</onlyinclude> pages have errors. Data as of '), output
+    assert output.endswith('.\n== {{lang name|name|fr}} ==\n* [[:Scout/fr]]\n# [[:Espion/fr]]\n# [[:Éclaireur/fr]]\n'), output
+
+    with TemporaryDirectory() as temp_dir:
+      with open(f'{temp_dir}/report.txt', 'w', encoding='utf-8') as f:
+        report = report_writer(f)
+        report.item('[[:Éclaireur/fr]]')
+        try:
+          str(report)
+          assert False, 'Expected a TypeError'
+        except TypeError:
+          pass
+      with open(f.name, encoding='utf-8') as f:
+        assert f.read() == '* [[:Éclaireur/fr]]\n'
+
+  def test_split_report(self):
+    report = report_writer()
+    report.header('300 pages', f'{onlyinclude(300)} pages.')
+    for section in ['A', 'B', 'C']:
+      report.heading(section)
+      for i in range(100):
+        report.item(f'[[:{section} {i}]]')
+    preamble, parts = split_report(str(report), 1000)
+    assert preamble.startswith('{{DISPLAYTITLE: 300 pages}}') and '==' not in preamble
+    assert all(len(part.encode('utf-8')) <= 1000 for part in parts)
+    assert all(part.startswith('== ') for part in parts) # Oversized sections repeat their heading in each part
+    lines = [line for part in parts for line in part.splitlines() if not line.startswith('==')]
+    assert lines == [line for line in str(report).splitlines() if line.startswith('*')], 'Expected no lines to be dropped'
+
+    report = report_writer()
+    report.header('300 pages', f'{onlyinclude(300)} pages.')
+    for i in range(300):
+      report.item(f'[[:Page {i}]]')
+    preamble, parts = split_report(str(report), 1000)
+    assert preamble.startswith('{{DISPLAYTITLE: 300 pages}}') and '[[:Page' not in preamble
+    assert len(parts) > 1 and all(len(part.encode('utf-8')) <= 1000 for part in parts) # Reports without headings split between lines
+    assert ''.join(parts).count('[[:Page') == 300
+
+  def test_cassette(self):
+    with TemporaryDirectory() as temp_dir:
+      with FakeWikiServer(SyntheticWiki(200)) as server:
+        w = wiki.Wiki(server.api_url, cassette=Cassette(f'{temp_dir}/run.zip', 'record'))
+        recorded = [page.get_wiki_text() for page in w.get_all_pages()]
+        w.transport.cassette.close()
+        request_count = server.request_count
+
+      # The server is gone, so everything has to come from the cassette
+      w = wiki.Wiki(server.api_url, cassette=Cassette(f'{temp_dir}/run.zip'))
+      assert [page.get_wiki_text() for page in w.get_all_pages()] == recorded
+      assert w.transport.cassette.hits == request_count, (w.transport.cassette.hits, request_count)
+      try:
+        w.get('query', list='allusers')
+        assert False, 'Expected a cassette miss'
+      except CassetteMiss:
+        pass
 
 if __name__ == '__main__':
   tests = Tests()
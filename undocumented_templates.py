@@ -4,6 +4,7 @@ from wikitools import wiki
 from wikitools.page import Page
 
 verbose = False
+NEEDS = {'wikitext': ['Template']}
 
 def pagescraper(page, badpages):
   page_text = page.get_wiki_text()
@@ -27,8 +28,9 @@ def pagescraper(page, badpages):
 
 def main(w):
   navbox_templates = []
-  navbox = Page(w, 'Template:Navbox')
-  for page in navbox.get_transclusions(namespaces=['Template']):
+  navbox_transclusions = list(Page(w, 'Template:Navbox').get_transclusions(namespaces=['Template']))
+  w.prefetch_text(navbox_transclusions)
+  for page in navbox_transclusions:
     if page.title.lower().startswith('template:navbox'):
       continue # Exclude alternative navbox templates
     if page.title.lower().endswith('sandbox'):
@@ -39,7 +41,7 @@ def main(w):
 
   badpages = []
   with pagescraper_queue(pagescraper, badpages) as page_q:
-    for page in w.get_all_templates():
+    for page in w.get_all_templates(with_text=True):
       if '/' in page.title:
         continue # Don't include subpage templates like Template:Dictionary or Template:PatchDiff
       elif page.title[:13] == 'Template:User':
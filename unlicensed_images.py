@@ -3,6 +3,7 @@ from wikitools import wiki
 from wikitools.page import Page
 
 verbose = False
+NEEDS = {'titles': ['File']}
 
 def main(w):
   image_templates = [
@@ -4,6 +4,7 @@ from wikitools import wiki
 
 verbose = False
 LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NEEDS = {'wikitext': ['Template']}
 
 LANG_TEMPLATE_START = compile(r"""
   [^{]{{    # The start of a template '{{' which is not the start of a parameter '{{{'
@@ -107,7 +108,7 @@ def main(w):
   translations = {lang: [] for lang in LANGS}
   usage_counts = {}
   with pagescraper_queue(pagescraper, translations, usage_counts) as pages:
-    for page in w.get_all_templates():
+    for page in w.get_all_templates(with_text=True):
       if '/' in page.title:
         continue # Don't include subpage templates like Template:Dictionary and Template:PatchDiff
       if page.title[:13] == 'Template:User':
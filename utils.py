@@ -1,7 +1,12 @@
+import asyncio
+from contextvars import copy_context
+from io import StringIO
 from queue import Empty, Queue
 from threading import Thread, Event
 from time import gmtime, strftime
 
+from wikitools.tracing import tracer
+
 class meta_plural(type):
   def __getattr__(cls, word):
     if word.endswith('s'):
@@ -23,6 +28,91 @@ def whatlinkshere(title, count, **kwargs):
   return '{{fullurl:Special:WhatLinksHere/%s|%s}}' % (title, query)
 
 
+def onlyinclude(count):
+  # Other pages transclude reports to show just their count
+  return f'<onlyinclude>{count}</onlyinclude>'
+
+class report_writer:
+  """
+  Builds a report's wikitext one chunk at a time, into a buffer (or straight into a file), rather than copying the
+  whole report on every +=. str(report) is the finished report, when writing into the buffer.
+  """
+
+  def __init__(self, file=None):
+    self.file = file if file is not None else StringIO()
+
+  def write(self, text):
+    self.file.write(text)
+
+  def header(self, title, summary):
+    # e.g. header(f'{count} pages with errors', f'{onlyinclude(count)} pages have errors.')
+    self.write(f'{{{{DISPLAYTITLE: {title}}}}}\n{summary} Data as of {time_and_date()}.\n')
+
+  def heading(self, text, level=2):
+    self.write(f'{"=" * level} {text} {"=" * level}\n')
+
+  def lang_heading(self, language, level=2):
+    self.heading('{{lang name|name|%s}}' % language, level)
+
+  def item(self, text, marker='*'):
+    self.write(f'{marker} {text}\n')
+
+  def __str__(self):
+    if not hasattr(self.file, 'getvalue'):
+      raise TypeError(f'This report was written to {getattr(self.file, "name", "a file")}, read it from there instead')
+    return self.file.getvalue()
+
+def split_report(output, max_size):
+  """
+  Splits a report which is too big to save as one page into (preamble, [parts]), where each part is at most
+  max_size bytes (unless a single line is bigger). The preamble is everything before the first heading, i.e. the
+  DISPLAYTITLE and summary. Parts break between sections where possible; a section which is too big on its own is
+  split between lines, and each piece of it starts with the section's heading. Reports without headings are split
+  between lines, too.
+  """
+  preamble = []
+  sections = []
+  for line in output.splitlines(keepends=True):
+    if line.startswith('='):
+      sections.append([line])
+    elif sections:
+      sections[-1].append(line)
+    else:
+      preamble.append(line)
+  if sum(len(line.encode('utf-8')) for line in preamble) > max_size:
+    # No headings (or a huge introduction), so only the DISPLAYTITLE and summary stay in the preamble.
+    # The rest is split between lines like an oversized section, but without a heading to repeat.
+    sections.insert(0, [''] + preamble[2:])
+    preamble = preamble[:2]
+
+  pieces = [] # (size, text)
+  for section in sections:
+    sizes = [len(line.encode('utf-8')) for line in section]
+    if sum(sizes) <= max_size:
+      pieces.append((sum(sizes), ''.join(section)))
+      continue
+    heading, heading_size = section[0], sizes[0]
+    lines, size = [heading], heading_size
+    for line, line_size in zip(section[1:], sizes[1:]):
+      if size + line_size > max_size and len(lines) > 1:
+        pieces.append((size, ''.join(lines)))
+        lines, size = [heading], heading_size
+      lines.append(line)
+      size += line_size
+    pieces.append((size, ''.join(lines)))
+
+  parts = []
+  part, size = [], 0
+  for piece_size, text in pieces:
+    if part and size + piece_size > max_size:
+      parts.append(''.join(part))
+      part, size = [], 0
+    part.append(text)
+    size += piece_size
+  if part:
+    parts.append(''.join(part))
+  return ''.join(preamble), parts
+
 class pagescraper_queue:
   def __init__(self, thread_func, *args, num_threads=50):
     self.thread_func = thread_func
@@ -36,7 +126,8 @@ class pagescraper_queue:
     self.count = 0
     self.failures = 0
     for _ in range(self.num_threads):
-      thread = Thread(target=self.meta_thread_func)
+      # Run each thread in a copy of the caller's context, so that e.g. request metrics are attributed to the calling report
+      thread = Thread(target=copy_context().run, args=(self.meta_thread_func,))
       self.threads.append(thread)
       thread.start()
     return self
@@ -66,7 +157,8 @@ class pagescraper_queue:
           continue
 
       try:
-        self.thread_func(obj, *self.thread_func_args)
+        with tracer.span(self.thread_func.__name__, 'pagescraper', item=str(obj)):
+          self.thread_func(obj, *self.thread_func_args)
       except KeyboardInterrupt:
         self.done.set()
         self.q = Queue() # "Clear" the queue
@@ -100,5 +192,50 @@ class pagescraper_queue_single:
     if self.failures > 5:
       raise Exception(f'There were {self.failures} exceptions thrown during execution')
 
+class async_pagescraper_queue:
+  """
+  The asyncio equivalent of pagescraper_queue: thread_func must be a coroutine function, and each put() must be awaited.
+  Since workers are tasks instead of threads, it's reasonable to run hundreds of them.
+  """
+  def __init__(self, thread_func, *args, num_tasks=200):
+    self.thread_func = thread_func
+    self.thread_func_args = args
+    self.num_tasks = num_tasks
+
+  async def __aenter__(self):
+    self.q = asyncio.Queue(maxsize=self.num_tasks * 2) # Bounded, so that we don't list the entire wiki before processing it
+    self.count = 0
+    self.failures = 0
+    self.tasks = [asyncio.create_task(self.meta_task_func()) for _ in range(self.num_tasks)]
+    return self
+
+  async def put(self, obj):
+    await self.q.put(obj)
+    self.count += 1
+
+  def __len__(self):
+    return self.count
+
+  async def __aexit__(self, exc_type, exc_val, traceback):
+    if exc_type is None:
+      await self.q.join()
+    for task in self.tasks:
+      task.cancel()
+    await asyncio.gather(*self.tasks, return_exceptions=True)
+    if self.failures > 5:
+      raise Exception(f'There were {self.failures} exceptions thrown during execution')
+
+  async def meta_task_func(self):
+    while True:
+      obj = await self.q.get()
+      try:
+        await self.thread_func(obj, *self.thread_func_args)
+      except Exception:
+        self.failures += 1
+        import traceback
+        traceback.print_exc()
+      finally:
+        self.q.task_done()
+
 if __name__ == '__main__':
   print(f'There are {plural.translations(2)} but only {plural.dogs(1)}')
@@ -1,23 +1,35 @@
-from utils import plural, time_and_date, whatlinkshere
+import asyncio
+
+from utils import async_pagescraper_queue, plural, time_and_date, whatlinkshere
 from wikitools import wiki
-from wikitools.page import Page
+from wikitools.aio import AsyncPage, AsyncWiki
 
 verbose = False
 NAMESPACES = ['Main', 'Project', 'Help', 'File', 'Category']
 
-def main(w):
+async def pagescraper(template, wanted_templates):
+  use_count = 0
+  async for page in template.aget_transclusions(namespaces=NAMESPACES):
+    if page.title.startswith('Portal Wiki:Discussion'):
+      continue
+    use_count += 1
+
+  if use_count > 0:
+    if verbose:
+      print(f'Template {template.title} has {use_count} uses')
+    wanted_templates.append([use_count, template.title])
+
+async def count_uses(w, templates):
+  # One request (or more) per wanted template, so they're counted concurrently
   wanted_templates = []
-  for template in w.get_all_wanted_templates():
-    use_count = 0
-    for page in Page(w, template).get_transclusions(namespaces=NAMESPACES):
-      if page.title.startswith('Portal Wiki:Discussion'):
-        continue
-      use_count += 1
-
-    if use_count > 0:
-      if verbose:
-        print(f'Template {template} has {use_count} uses')
-      wanted_templates.append([use_count, template])
+  async with AsyncWiki(w) as aw:
+    async with async_pagescraper_queue(pagescraper, wanted_templates) as pages:
+      for template in templates:
+        await pages.put(AsyncPage(aw, template))
+  return wanted_templates
+
+def main(w):
+  wanted_templates = asyncio.run(count_uses(w, list(w.get_all_wanted_templates())))
 
   output = """\
 {{{{DISPLAYTITLE: {count} wanted templates}}}}
@@ -0,0 +1,213 @@
+import asyncio
+from json import loads
+from time import monotonic
+import aiohttp
+import requests
+
+from .governor import parse_retry_after
+from .metrics import endpoint_name
+from .page import Page
+
+# Errors which mean "unable to load this resource", like requests.exceptions.RequestException (which cassettes raise)
+REQUEST_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.RequestException)
+
+class AsyncWiki:
+  """
+  An asyncio view of a Wiki, for reports which want to keep hundreds of requests in flight
+  without running a thread for each one. This client is read-only (no login or edits).
+  Requests share the Wiki's governor and metrics (so they count towards the same limits and reports as its threads),
+  as well as its caches, namespaces and memoized lists. Use it as an async context manager:
+    async with AsyncWiki(w) as aw: ...
+  """
+
+  def __init__(self, wiki):
+    self.wiki = wiki
+    self.api_url = wiki.api_url
+    self.wiki_url = wiki.wiki_url
+    self.namespaces = wiki.namespaces
+    self.page_text_cache = wiki.page_text_cache
+    self.page_html_cache = wiki.page_html_cache
+    self.governor = wiki.governor
+    self.metrics = wiki.metrics
+    self.max_attempts = wiki.transport.max_attempts
+    connect_timeout, read_timeout = wiki.transport.timeout
+    self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+    self.session = None
+
+  async def __aenter__(self):
+    # aiohttp sessions must be created from within the event loop.
+    # The governor already limits requests in flight, so the connector only needs room for as many.
+    self.session = aiohttp.ClientSession(
+      connector=aiohttp.TCPConnector(limit=self.governor.max_in_flight),
+      timeout=self.timeout,
+    )
+    return self
+
+  async def __aexit__(self, exc_type, exc_val, traceback):
+    await self.session.close()
+
+  def __eq__(self, other):
+    return self.api_url == other.api_url
+
+  async def fetch(self, url, params):
+    # The same retries as Transport.send: overloads (and connection errors) are reported to the governor,
+    # which pauses every request (threaded or not) until the server has recovered.
+    params = {key: str(value) for key, value in params.items() if value is not None} # aiohttp only accepts strings
+    if self.wiki.transport.cassette:
+      # Recording or replaying, so go through the Wiki's transport (in a thread), to keep the cassette complete
+      r = await asyncio.to_thread(self.wiki.transport.get, url, params=params)
+      r.raise_for_status()
+      return r.text
+    endpoint = endpoint_name(url, params)
+    for attempt in range(1, self.max_attempts + 1):
+      wait_start = monotonic()
+      while not self.governor.try_acquire():
+        await asyncio.sleep(0.05)
+      start = monotonic()
+      try:
+        async with self.session.get(url, params=params) as r:
+          body = await r.read()
+          text = await r.text()
+      except REQUEST_ERRORS as e:
+        self.metrics.record(endpoint, status=type(e).__name__, latency=monotonic() - start, size=0, retry=attempt > 1, wait=start - wait_start)
+        self.governor.release(overloaded=True)
+        if attempt == self.max_attempts:
+          raise
+        continue
+      except BaseException:
+        self.governor.release()
+        raise
+
+      self.metrics.record(endpoint, status=r.status, latency=monotonic() - start, size=len(body), retry=attempt > 1, wait=start - wait_start)
+
+      overloaded = r.status in [429, 502, 503] or r.headers.get('MediaWiki-API-Error') == 'maxlag'
+      self.governor.release(overloaded=overloaded, retry_after=parse_retry_after(r.headers.get('Retry-After')))
+      if not overloaded or attempt == self.max_attempts:
+        r.raise_for_status()
+        return text
+
+  async def get(self, action, **params):
+    params.update({
+      'action': action,
+      'format': 'json',
+      'maxlag': self.wiki.maxlag,
+    })
+    j = loads(await self.fetch(self.api_url, params))
+    if 'warnings' in j:
+      print(f'{self.api_url} {params}\tWarning: ' + str(j['warnings']))
+    return j
+
+  async def get_with_continue(self, action, entry_key, **kwargs):
+    # Lists are memoized along with the Wiki's (see Wiki.get_with_continue)
+    memo_key = self.wiki.get_memo_key(action, entry_key, kwargs)
+    if memo_key in self.wiki.list_memo:
+      for entry in self.wiki.list_memo[memo_key]:
+        yield entry
+      return
+
+    entries = []
+    while 1:
+      try:
+        data = await self.get(action, **kwargs)
+      except REQUEST_ERRORS:
+        return # Unable to load more info for this query
+      if data == {'batchcomplete': ''}:
+        break # No entries for this query
+      if 'error' in data:
+        print('Error: ' + str(data['error']))
+        return
+
+      try:
+        page_entries = data[action][entry_key]
+      except KeyError:
+        print(f'Entry key "{entry_key}" was not found in data. Keys were: {", ".join(data.get(action, data).keys())}')
+        return
+
+      if isinstance(page_entries, dict):
+        page_entries = page_entries.values()
+      for entry in page_entries:
+        if memo_key:
+          entries.append(entry)
+        yield entry
+
+      if 'continue' in data:
+        kwargs.update(data['continue'])
+      else:
+        break
+    if memo_key: # Only remember lists which completed
+      self.wiki.list_memo[memo_key] = entries
+
+  async def get_all_pages(self, *, namespaces=None, redirects=False):
+    if namespaces is None:
+      namespaces = ['Main']
+    redirect_filter = {
+      False: 'nonredirects',
+      True: 'redirects',
+      None: 'all',
+    }[redirects]
+
+    for namespace in namespaces:
+      async for entry in self.get_with_continue('query', 'allpages',
+        list='allpages',
+        aplimit=500,
+        apnamespace=self.namespaces[namespace],
+        apfilterredir=redirect_filter,
+      ):
+        title = entry['title']
+        if title.endswith('.js') or title.endswith('.css'):
+          continue
+        yield AsyncPage(self, title, entry)
+
+  async def get_all_templates(self):
+    async for page in self.get_all_pages(namespaces=['Template']):
+      yield page
+
+
+class AsyncPage(Page):
+  """A Page which belongs to an AsyncWiki, with coroutine versions of the network calls."""
+  __slots__ = ()
+
+  async def aget_wiki_text(self):
+    revid = (self.raw.get('lastrevid') or self.raw.get('revid')) if self.raw else None
+    cached_text = self.wiki.page_text_cache.get(self.title, None, revid=revid)
+    if cached_text:
+      return cached_text
+    try:
+      raw = await self.wiki.get('parse', page=self.url_title, prop='wikitext|revid')
+      if 'error' in raw:
+        print(f'Error while fetching {self.url_title} contents: ' + str(raw['error']))
+        return '' # Unable to fetch page contents, pretend it's empty
+      text = raw['parse']['wikitext']['*']
+      self.wiki.page_text_cache.set(self.title, text, raw['parse'].get('revid'))
+      return text
+    except REQUEST_ERRORS:
+      return '' # Unable to fetch page contents, pretend it's empty
+
+  async def aget_raw_html(self):
+    cached_html = self.wiki.page_html_cache.get(self.title, None)
+    if cached_html:
+      return cached_html
+    try:
+      html = await self.wiki.fetch(self.wiki.wiki_url, {'title': self.url_title})
+      self.wiki.page_html_cache[self.title] = html
+      return html
+    except REQUEST_ERRORS:
+      return '' # Unable to fetch page contents, pretend it's empty
+
+  async def aget_links(self, *, namespaces=None):
+    async for entry in self.wiki.get_with_continue('query', 'pages',
+      generator='links',
+      gplnamespace=self.join_namespaces(namespaces),
+      gpllimit=500,
+      titles=self.url_title,
+    ):
+      yield AsyncPage(self.wiki, entry['title'], entry)
+
+  async def aget_transclusions(self, *, namespaces=None):
+    async for entry in self.wiki.get_with_continue('query', 'embeddedin',
+      list='embeddedin',
+      einamespace=self.join_namespaces(namespaces),
+      eilimit=500,
+      eititle=self.url_title,
+    ):
+      yield AsyncPage(self.wiki, entry['title'], entry)
@@ -0,0 +1,100 @@
+from atexit import register
+from hashlib import sha1
+from json import dumps, loads
+from os import environ
+from threading import Lock
+from time import sleep
+from zipfile import ZipFile, ZIP_DEFLATED
+import requests
+
+# Parameters which change from run to run (or are secret), and so are not part of a request's signature.
+# Edit text and summaries are excluded because reports include the current time in them.
+VOLATILE_PARAMS = {'token', 'lgtoken', 'lgpassword', 'maxlag', 'rcstart', 'rcend', 'lestart', 'leend', 'text', 'summary'}
+
+# Response headers which the governor or the reports look at. Everything else is dropped.
+KEPT_HEADERS = ['Content-Type', 'Retry-After', 'MediaWiki-API-Error']
+
+class CassetteMiss(requests.exceptions.RequestException):
+  pass
+
+class Cassette:
+  """
+  Records every HTTP response of a run into a zip file, or replays them (with optional simulated latency).
+  Each response is one compressed member, named by a hash of the request's method, URL and parameters,
+  so a report can be rerun offline and bit-for-bit, e.g. to benchmark CPU-side changes without network noise.
+  Requests which are missing from the cassette raise a RequestException, like a network error would.
+  """
+
+  def __init__(self, path, mode='replay', latency=0):
+    if mode not in ['record', 'replay']:
+      raise ValueError(f'Unknown cassette mode {mode}, expected "record" or "replay"')
+    self.path = path
+    self.mode = mode
+    self.latency = latency
+    self.lock = Lock()
+    self.zip = ZipFile(path, 'w' if mode == 'record' else 'r', compression=ZIP_DEFLATED)
+    self.names = set(self.zip.namelist())
+    self.hits = 0
+    self.misses = 0
+    if mode == 'record':
+      register(self.close) # The zip's index is only written on close
+
+  @staticmethod
+  def from_environ():
+    # WIKI_CASSETTE=run.zip WIKI_CASSETTE_MODE=record python master.py
+    path = environ.get('WIKI_CASSETTE')
+    if not path:
+      return None
+    return Cassette(path, environ.get('WIKI_CASSETTE_MODE', 'replay'), float(environ.get('WIKI_CASSETTE_LATENCY', 0)))
+
+  def close(self):
+    with self.lock:
+      if self.zip.fp:
+        self.zip.close()
+
+  @staticmethod
+  def signature(method, url, kwargs):
+    params = {**(kwargs.get('params') or {}), **(kwargs.get('data') or {})}
+    params = sorted((key, str(value)) for key, value in params.items() if key not in VOLATILE_PARAMS)
+    files = sorted((key, file[0]) for key, file in (kwargs.get('files') or {}).items())
+    return sha1(dumps([method, url, params, files]).encode('utf-8')).hexdigest()
+
+  def request(self, session, method, url, **kwargs):
+    if self.mode == 'replay':
+      return self.replay(method, url, kwargs)
+    r = session.request(method, url, **kwargs)
+    self.record(method, url, kwargs, r)
+    return r
+
+  def record(self, method, url, kwargs, r):
+    if r.status_code in [429, 502, 503]:
+      return # Transient failures are retried, so only the final response is kept
+    name = self.signature(method, url, kwargs)
+    headers = {key: r.headers[key] for key in KEPT_HEADERS if key in r.headers}
+    metadata = dumps({'status': r.status_code, 'url': r.url, 'encoding': r.encoding, 'headers': headers})
+    with self.lock:
+      if name in self.names:
+        return # Only keep the first response, which is the one that replay would have served
+      self.names.add(name)
+      self.zip.writestr(name, metadata.encode('utf-8') + b'\n' + r.content)
+
+  def replay(self, method, url, kwargs):
+    name = self.signature(method, url, kwargs)
+    if self.latency:
+      sleep(self.latency)
+    with self.lock:
+      if name not in self.names:
+        self.misses += 1
+        raise CassetteMiss(f'Request was not recorded in {self.path}: {method} {url} {kwargs.get("params") or kwargs.get("data")}')
+      self.hits += 1
+      data = self.zip.read(name)
+
+    metadata, _, content = data.partition(b'\n')
+    metadata = loads(metadata)
+    r = requests.Response()
+    r.status_code = metadata['status']
+    r.url = metadata['url']
+    r.encoding = metadata['encoding']
+    r.headers.update(metadata['headers'])
+    r._content = content
+    return r
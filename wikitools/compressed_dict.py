@@ -0,0 +1,183 @@
+import zlib
+from collections import OrderedDict
+from threading import Lock
+
+from .disk_store import DiskStore
+from .tracing import tracer
+
+def train_dictionary(samples, size=32 * 1024):
+  """
+  Builds a zlib preset dictionary from the lines which most samples share (e.g. the wiki skin around every page's HTML).
+  Entries are compressed as if they followed the dictionary, so boilerplate compresses down to back-references.
+  """
+  counts = {}
+  for sample in samples:
+    for line in set(sample.splitlines(keepends=True)):
+      counts[line] = counts.get(line, 0) + 1
+  shared = [line for line, count in counts.items() if count * 2 > len(samples) and len(line) > 8]
+  # zlib can only reference the last 32KB of the dictionary, and nearer data is cheaper to reference,
+  # so the most widely shared lines go at the end.
+  shared.sort(key=lambda line: counts[line])
+  return b''.join(shared)[-size:]
+
+class Shard:
+  def __init__(self):
+    self.entries = OrderedDict() # key: entry, least recently used first
+    self.lock = Lock()
+    self.size = 0 # Compressed bytes
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+class CompressedDict:
+  """
+  A memory-light, thread-safe dictionary of strings. Each value is compressed on its own (so values can be
+  overwritten and deleted), against a dictionary trained from the first few values, which captures the boilerplate
+  that pages have in common. Entries are split across shards with their own locks, and compression happens outside
+  of any lock, so many threads can read and write at once.
+  If memory_budget is set, the least recently used entries beyond that many compressed bytes are evicted to a
+  temporary database on disk, and moved back into memory when they're next used.
+  """
+
+  def __init__(self, *, shards=16, level=6, train_after=16, memory_budget=None):
+    self.shards = [Shard() for _ in range(shards)]
+    self.level = level
+    self.train_after = train_after
+    self.samples = []
+    self.zdict = None
+    self.training_lock = Lock()
+    self.shard_budget = memory_budget // shards if memory_budget else None
+    self.spill = None
+    self.spill_lock = Lock()
+
+  def shard(self, key):
+    return self.shards[hash(key) % len(self.shards)]
+
+  # Entries are (raw size, whether they were compressed with the trained dictionary, compressed data)
+  def compress(self, data):
+    zdict = self.zdict
+    if zdict is None:
+      return (len(data), False, zlib.compress(data, self.level))
+    compressor = zlib.compressobj(self.level, zdict=zdict)
+    return (len(data), True, compressor.compress(data) + compressor.flush())
+
+  def decompress(self, entry):
+    _, uses_zdict, data = entry
+    if not uses_zdict:
+      return zlib.decompress(data)
+    decompressor = zlib.decompressobj(zdict=self.zdict)
+    return decompressor.decompress(data) + decompressor.flush()
+
+  def train(self, data):
+    with self.training_lock:
+      if self.zdict is not None:
+        return
+      self.samples.append(data)
+      if len(self.samples) >= self.train_after:
+        self.zdict = train_dictionary(self.samples)
+        self.samples = None
+
+  def spill_store(self):
+    with self.spill_lock:
+      if self.spill is None:
+        self.spill = DiskStore()
+      return self.spill
+
+  def store(self, shard, key, entry):
+    # Must be called with the shard's lock held
+    old_entry = shard.entries.pop(key, None)
+    if old_entry is not None:
+      shard.size -= len(old_entry[2])
+    shard.entries[key] = entry
+    shard.size += len(entry[2])
+
+    while self.shard_budget and shard.size > self.shard_budget and len(shard.entries) > 1:
+      evicted_key, evicted_entry = shard.entries.popitem(last=False)
+      shard.size -= len(evicted_entry[2])
+      shard.evictions += 1
+      self.spill_store().set(evicted_key, evicted_entry)
+
+  def __getitem__(self, key):
+    shard = self.shard(key)
+    with tracer.locked(shard.lock, 'compressed dict shard'):
+      entry = shard.entries.get(key)
+      if entry is not None:
+        shard.entries.move_to_end(key)
+        shard.hits += 1
+      else:
+        if self.spill is not None:
+          entry = self.spill.pop(key)
+        if entry is None:
+          shard.misses += 1
+          raise KeyError(key)
+        shard.disk_hits += 1
+        self.store(shard, key, entry)
+    return self.decompress(entry).decode('utf-8')
+
+  def get(self, key, default=None):
+    try:
+      value = self.__getitem__(key)
+      tracer.instant('compressed dict hit', 'cache', key=key)
+      return value
+    except KeyError:
+      tracer.instant('compressed dict miss', 'cache', key=key)
+      return default
+
+  def __setitem__(self, key, value):
+    data = value.encode('utf-8')
+    if self.zdict is None:
+      self.train(data)
+    entry = self.compress(data) # Outside of the lock, since this is the slow part
+    shard = self.shard(key)
+    with tracer.locked(shard.lock, 'compressed dict shard'):
+      if self.spill is not None:
+        self.spill.discard(key)
+      self.store(shard, key, entry)
+
+  def __delitem__(self, key):
+    shard = self.shard(key)
+    with tracer.locked(shard.lock, 'compressed dict shard'):
+      entry = shard.entries.pop(key, None)
+      if entry is not None:
+        shard.size -= len(entry[2])
+      elif self.spill is None or self.spill.pop(key) is None:
+        raise KeyError(key)
+
+  def discard(self, key):
+    try:
+      del self[key]
+    except KeyError:
+      pass
+
+  def __contains__(self, key):
+    return key in self.shard(key).entries or (self.spill is not None and key in self.spill)
+
+  def __len__(self):
+    return sum(len(shard.entries) for shard in self.shards) + (len(self.spill) if self.spill is not None else 0)
+
+  def clear(self):
+    for shard in self.shards:
+      with shard.lock:
+        shard.entries.clear()
+        shard.size = 0
+    if self.spill is not None:
+      self.spill.clear()
+
+  def stats(self):
+    stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+    for shard in self.shards:
+      for counter in stats:
+        stats[counter] += getattr(shard, counter)
+    stats['memory_entries'] = sum(len(shard.entries) for shard in self.shards)
+    stats['memory_bytes'] = self.compressed_bytes
+    return stats
+
+  # Sizes of the entries in memory, for checking how well the cache compresses
+  @property
+  def raw_bytes(self):
+    return sum(entry[0] for shard in self.shards for entry in list(shard.entries.values()))
+
+  @property
+  def compressed_bytes(self):
+    return sum(shard.size for shard in self.shards)
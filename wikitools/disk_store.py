@@ -0,0 +1,49 @@
+import marshal
+from os import path
+from sqlite3 import connect
+from tempfile import TemporaryDirectory
+from threading import Lock
+
+class DiskStore:
+  """
+  A key-value store in a temporary sqlite database, which memory-budgeted caches spill their evicted entries into.
+  Values can be anything marshal supports (strings, bytes, numbers, and tuples of those).
+  The database is deleted along with this object.
+  """
+
+  def __init__(self):
+    self.temp_dir = TemporaryDirectory(prefix='wiki_cache_')
+    self.lock = Lock()
+    self.db = connect(path.join(self.temp_dir.name, 'spill.sqlite3'), check_same_thread=False, isolation_level=None)
+    # This is scratch space, so trade durability for speed.
+    self.db.execute('PRAGMA journal_mode=OFF')
+    self.db.execute('PRAGMA synchronous=OFF')
+    self.db.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB)')
+
+  def set(self, key, value):
+    with self.lock:
+      self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?)', (key, marshal.dumps(value)))
+
+  def pop(self, key, default=None):
+    with self.lock:
+      row = self.db.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+      if row is None:
+        return default
+      self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+    return marshal.loads(row[0])
+
+  def discard(self, key):
+    with self.lock:
+      self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+  def __contains__(self, key):
+    with self.lock:
+      return self.db.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone() is not None
+
+  def clear(self):
+    with self.lock:
+      self.db.execute('DELETE FROM entries')
+
+  def __len__(self):
+    with self.lock:
+      return self.db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
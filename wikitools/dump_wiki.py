@@ -0,0 +1,154 @@
+import bz2
+import gzip
+from os import environ, path
+from re import compile
+from sqlite3 import connect
+from tempfile import TemporaryDirectory
+from threading import Lock
+from xml.etree.ElementTree import iterparse
+
+from .page import Page
+from .text_cache import TextCache
+from .compressed_dict import CompressedDict
+
+# Template transclusions, e.g. {{Foo|bar}} or {{ Foo }}, but not parameters like {{{1}}} or parser functions like {{#if:}}
+TRANSCLUSION = compile(r'(?<!{){{(?!{)\s*([^{}|#<>\[\]\n]+?)\s*(?:\||}})')
+
+class DumpWiki:
+  """
+  A read-only Wiki backed by a MediaWiki XML export (pages-articles.xml, optionally .bz2 or .gz compressed).
+  The dump is streamed once into a temporary on-disk index, so memory use doesn't depend on the size of the dump.
+  Supports the page enumeration APIs, Page.get_wiki_text, and Page.get_transclusions (direct transclusions only,
+  since the dump doesn't include templates which are transcluded through other templates).
+  """
+
+  def __init__(self, dump_path, api_url=None):
+    self.dump_path = dump_path
+    # Only used to generate links in report output
+    self.api_url = environ.get('WIKI_API_URL') or api_url or 'https://wiki.teamfortress.com/w/api.php'
+    self.wiki_url = self.api_url.replace('api.php', 'index.php')
+
+    self.temp_dir = TemporaryDirectory()
+    self.page_text_cache = TextCache(self.temp_dir.name)
+    self.page_html_cache = CompressedDict()
+    self.lock = Lock()
+    self.db = connect(path.join(self.temp_dir.name, 'dump.sqlite3'), check_same_thread=False)
+    self.db.execute('CREATE TABLE pages (title TEXT PRIMARY KEY, ns INTEGER, pageid INTEGER, revid INTEGER, redirect INTEGER)')
+    self.db.execute('CREATE TABLE transclusions (template TEXT, title TEXT, ns INTEGER)')
+
+    self.namespaces = {}
+    self.load_dump()
+
+  def __eq__(self, other):
+    return self.dump_path == getattr(other, 'dump_path', None)
+
+  def open_dump(self):
+    if self.dump_path.endswith('.bz2'):
+      return bz2.open(self.dump_path, 'rb')
+    elif self.dump_path.endswith('.gz'):
+      return gzip.open(self.dump_path, 'rb')
+    return open(self.dump_path, 'rb')
+
+  def load_dump(self):
+    print(f'Loading {self.dump_path}...')
+    with self.open_dump() as f:
+      root = None
+      for event, elem in iterparse(f, events=['start', 'end']):
+        if root is None:
+          root = elem
+        if event != 'end':
+          continue
+        tag = elem.tag.rpartition('}')[2] # Strip the XML namespace, which changes with the export version
+        if tag == 'namespaces':
+          for namespace in elem:
+            self.namespaces[namespace.text or ''] = int(namespace.get('key'))
+          self.namespaces['*'] = '*' # 'All', in many queries
+          self.namespaces['Main'] = self.namespaces['']
+          if 'Team Fortress Wiki' in self.namespaces:
+            self.namespaces['TFW'] = self.namespaces['Team Fortress Wiki']
+        elif tag == 'page':
+          self.load_page({child.tag.rpartition('}')[2]: child for child in elem})
+          root.clear() # Discard the parsed page, so that memory doesn't grow with the size of the dump
+    self.db.execute('CREATE INDEX transclusion_templates ON transclusions (template)')
+    self.db.commit()
+    print(f'Loaded {self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]} pages')
+
+  def load_page(self, children):
+    title = children['title'].text
+    ns = int(children['ns'].text)
+    revision = {child.tag.rpartition('}')[2]: child for child in children['revision']}
+    revid = int(revision['id'].text)
+    text = revision['text'].text or ''
+
+    self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)', (title, ns, int(children['id'].text), revid, 'redirect' in children))
+    self.page_text_cache.set(title, text, revid)
+
+    templates = set()
+    for m in TRANSCLUSION.finditer(text):
+      name = m.group(1).replace('_', ' ')
+      namespace, colon, basename = name.partition(':')
+      if not colon:
+        namespace, basename = 'Template', name
+      elif namespace == '':
+        pass # {{:Foo}} transcludes a main namespace page
+      elif namespace not in self.namespaces:
+        continue # Magic words like {{DISPLAYTITLE:}} or {{lc:}}
+      basename = basename[:1].upper() + basename[1:] # Mediawiki titles are case-insensitive in the first letter
+      templates.add(f'{namespace}:{basename}' if namespace else basename)
+    self.db.executemany('INSERT INTO transclusions VALUES (?, ?, ?)', ((template, title, ns) for template in templates))
+
+  def get(self, action, **params):
+    # Dumps never make requests (and have no Transport), so nothing here is shared with single-flight, governed or retried.
+    return {'error': {'code': 'offline', 'info': f'Cannot make API requests ({action}) against a dump'}}
+
+  def query(self, sql, *args):
+    with self.lock:
+      return self.db.execute(sql, args).fetchall()
+
+  def get_with_continue(self, action, entry_key, **kwargs):
+    # Page methods query the API directly, so we emulate the few queries that can be answered from the dump.
+    if kwargs.get('list') == 'embeddedin':
+      namespaces = str(kwargs['einamespace']).split('|')
+      for title, ns in self.query('SELECT title, ns FROM transclusions WHERE template = ? ORDER BY title', kwargs['eititle'].replace('_', ' ')):
+        if '*' in namespaces or str(ns) in namespaces:
+          yield {'title': title, 'ns': ns}
+    else:
+      print(f'Query is not supported for dumps: {kwargs}')
+
+  def get_all_pages(self, *, namespaces=None, redirects=False, with_text=False, keep_raw=True):
+    # keep_raw is accepted for compatibility with Wiki.get_all_pages; each entry here is only a few fields anyways.
+    if namespaces is None:
+      namespaces = ['Main']
+    for namespace in namespaces:
+      for title, ns, pageid, revid, redirect in self.query('SELECT * FROM pages WHERE ns = ? ORDER BY title', self.namespaces[namespace]):
+        if redirects is not None and bool(redirect) != redirects:
+          continue
+        if title.endswith('.js') or title.endswith('.css'):
+          continue
+        yield Page(self, title, {'title': title, 'ns': ns, 'pageid': pageid, 'lastrevid': revid})
+
+  def get_all_templates(self, *, with_text=False):
+    return self.get_all_pages(namespaces=['Template'])
+
+  def get_all_categories(self, filter_redirects=True):
+    return self.get_all_pages(namespaces=['Category'], redirects=False if filter_redirects else None)
+
+  def prefetch_text(self, pages):
+    pass # All page contents are already loaded
+
+
+if __name__ == '__main__':
+  # Usage: python -m wikitools.dump_wiki pages-articles.xml.bz2 report [report...]
+  import importlib
+  import sys
+  w = DumpWiki(sys.argv[1])
+  for module in sys.argv[2:]:
+    output = importlib.import_module(module).main(w)
+    with open(f'wiki_{module}.txt', 'w', encoding='utf-8') as f:
+      if isinstance(output, list):
+        for lang, lang_output in output:
+          f.write(f'\n===== {lang} =====\n')
+          f.write(lang_output)
+      else:
+        f.write(output)
+    print(f'Article written to {f.name}')
@@ -0,0 +1,583 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from email.utils import format_datetime
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from random import Random
+from re import MULTILINE, search
+from threading import Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import parse_qsl, urlparse
+from zlib import crc32
+
+LANGS = ['ar', 'cs', 'da', 'de', 'es', 'fi', 'fr', 'hu', 'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'pt-br', 'ro', 'ru', 'sv', 'tr', 'zh-hans', 'zh-hant']
+NAMESPACES = {'': 0, 'Talk': 1, 'User': 2, 'Team Fortress Wiki': 4, 'File': 6, 'MediaWiki': 8, 'Template': 10, 'Help': 12, 'Category': 14}
+CANONICAL_NAMESPACES = {4: 'Project', 6: 'File', 10: 'Template', 12: 'Help', 14: 'Category'}
+WORDS = ['Scout', 'Soldier', 'Pyro', 'Demoman', 'Heavy', 'Engineer', 'Medic', 'Sniper', 'Spy', 'Rocket', 'Sentry', 'Payload',
+         'Crate', 'Hat', 'Update', 'Map', 'Taunt', 'Medal', 'Strange', 'Unusual', 'Mann', 'Saxton', 'Badlands', 'Gravel']
+SKIN = ''.join(f'<li id="n-{word}"><a href="/wiki/{word}" title="{word}">{word}</a></li>\n' for word in WORDS * 20)
+
+class SyntheticWiki:
+  """
+  A deterministic, generated wiki with the same shape as the TF2 wiki: english articles with /lang translations,
+  templates (including navboxes and {{lang}} switches), categories, files, and redirects.
+  Only titles are kept in memory; page contents and links are regenerated from each title on demand,
+  so that wikis with a million pages are practical.
+  """
+
+  def __init__(self, num_pages=10000, *, seed=0, translation_rate=0.3, redirect_rate=0.05):
+    self.seed = seed
+    self.redirect_rate = redirect_rate
+    self.now = datetime(2024, 1, 1)
+    self.edits = {} # title: (revid, text) for pages edited through the API
+    self.lock = Lock()
+    rng = Random(seed)
+
+    # Split the pages roughly the way the real wiki is split
+    shares = {'Template': 0.05, 'Category': 0.03, 'File': 0.06, 'Help': 0.01, 'Team Fortress Wiki': 0.01}
+    self.titles = {ns: [] for ns in NAMESPACES.values()}
+    for namespace, share in list(shares.items()) + [('', 1 - sum(shares.values()))]:
+      titles = self.titles[NAMESPACES[namespace]]
+      prefix = f'{namespace}:' if namespace else ''
+      i = 0
+      while len(titles) < num_pages * share:
+        base = f'{prefix}{rng.choice(WORDS)} {rng.choice(WORDS)} {i}'
+        i += 1
+        if namespace == 'File':
+          titles.append(base + '.png')
+          titles.extend(f'{base} {lang}.png' for lang in LANGS if rng.random() < translation_rate / 4)
+        elif namespace == 'Template':
+          titles.append(base + (' Nav' if i % 10 == 0 else ''))
+        else:
+          titles.append(base)
+          titles.extend(f'{base}/{lang}' for lang in LANGS if rng.random() < translation_rate)
+    self.titles[NAMESPACES['Template']] += ['Template:Navbox', 'Template:Lang', 'Template:Non-article category', 'Template:Documentation']
+    for titles in self.titles.values():
+      titles.sort()
+    self.all_titles = {title for titles in self.titles.values() for title in titles}
+    self.article_titles = [title for title in self.titles[0] if '/' not in title]
+    self.template_titles = [title for title in self.titles[NAMESPACES['Template']] if not self.is_navbox(title)]
+    self.navbox_titles = [title for title in self.titles[NAMESPACES['Template']] if self.is_navbox(title)]
+    self.category_titles = [title for title in self.titles[NAMESPACES['Category']] if '/' not in title]
+    self.transclusions = None # Reverse indices, built on first use
+    self.category_members = None
+
+  # Per-page data, all derived from a hash of the title
+  def rng(self, title):
+    return Random(crc32(f'{self.seed}:{title}'.encode('utf-8')))
+
+  def hash(self, title, salt):
+    # Cheaper than rng(), for the data which has to be computed for every page when building the reverse indices
+    return crc32(f'{self.seed}:{title}#{salt}'.encode('utf-8'))
+
+  def namespace(self, title):
+    prefix, colon, _ = title.partition(':')
+    return NAMESPACES.get(prefix, 0) if colon else 0
+
+  def exists(self, title):
+    return title in self.all_titles
+
+  def lang(self, title):
+    lang = title.rpartition('/')[2]
+    return lang if lang in LANGS else 'en'
+
+  def is_redirect(self, title):
+    return self.namespace(title) in [0, 4, 12] and self.hash(title, 'redirect') % 10000 < self.redirect_rate * 10000
+
+  def is_navbox(self, title):
+    return title.startswith('Template:') and title.endswith(' Nav')
+
+  def revid(self, title):
+    if title in self.edits:
+      return self.edits[title][0]
+    return crc32(title.encode('utf-8')) % 10_000_000 + 1
+
+  def touched(self, title):
+    if title in self.edits: # Each edit moves the timestamp forwards
+      return self.now + timedelta(seconds=self.edits[title][0] - 10_000_000)
+    return self.now - timedelta(minutes=self.hash(title, 'touched') % (5 * 365 * 24 * 60))
+
+  def timestamp(self, title):
+    return self.touched(title).strftime(r'%Y-%m-%dT%H:%M:%SZ')
+
+  def links(self, title):
+    rng = self.rng(title)
+    lang = self.lang(title)
+    if self.is_redirect(title):
+      return [rng.choice(self.article_titles)]
+    links = []
+    for article in rng.sample(self.article_titles, min(len(self.article_titles), rng.randint(0, 20))):
+      if lang != 'en':
+        # Mostly link to the same language, but sometimes to english or (incorrectly) another language
+        article += '/' + (lang if rng.random() < 0.95 else rng.choice(LANGS))
+      links.append(article)
+    if self.is_navbox(title):
+      links += rng.sample(self.article_titles, min(len(self.article_titles), 15))
+    return links
+
+  def templates(self, title):
+    if self.is_redirect(title):
+      return []
+    h = self.hash(title, 'templates')
+    templates = ['Template:Lang'] if h % 2 else []
+    if self.namespace(title) == 0:
+      if self.template_titles:
+        templates.append(self.template_titles[(h >> 1) % len(self.template_titles)])
+        templates.append(self.template_titles[(h >> 12) % len(self.template_titles)])
+      if self.navbox_titles and (h >> 24) % 10 < 3:
+        templates.append(self.navbox_titles[(h >> 4) % len(self.navbox_titles)])
+      if (h >> 8) % 100 == 0:
+        templates.append(f'Template:Missing {(h >> 16) % 21}')
+    elif self.is_navbox(title):
+      templates.append('Template:Navbox')
+    return list(dict.fromkeys(templates))
+
+  def page_categories(self, title):
+    if self.is_redirect(title) or not self.category_titles:
+      return []
+    h = self.hash(title, 'categories')
+    suffix = '' if self.lang(title) == 'en' else '/' + self.lang(title)
+    categories = [self.category_titles[h % len(self.category_titles)], self.category_titles[(h >> 12) % len(self.category_titles)]]
+    return [category + suffix for category in dict.fromkeys(categories)]
+
+  def text(self, title):
+    if title in self.edits:
+      return self.edits[title][1]
+    rng = self.rng(title + '#text')
+    if self.is_redirect(title):
+      return f'#REDIRECT [[{self.links(title)[0]}]]'
+
+    lines = []
+    if rng.random() < 0.05:
+      lines.append(f'{{{{DISPLAYTITLE:{title}}}}}')
+    for template in self.templates(title):
+      name = template.partition(':')[2]
+      if name == 'Lang':
+        translated = [lang for lang in LANGS if rng.random() < 0.8]
+        lines.append('{{lang\n| en = English text\n' + ''.join(f'| {lang} = Text in {lang}\n' for lang in translated) + '}}')
+      elif name == 'Navbox':
+        lines.append('{{Navbox\n| title = ' + title + '\n| list1 = ' + ' • '.join(f'[[{link}]]' for link in self.links(title)) + '\n}}')
+      else:
+        lines.append(f'{{{{{name}|{rng.choice(WORDS)}}}}}')
+    if self.namespace(title) == NAMESPACES['Template'] and rng.random() < 0.5:
+      lines.append('{{{1}}} and {{{2|default}}}')
+      if rng.random() < 0.5:
+        lines.append('<noinclude>{{Documentation}}</noinclude>')
+    for _ in range(rng.randint(1, 8)):
+      words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 60)))
+      if rng.random() < 0.2:
+        words += f' [https://example-{rng.randint(0, 500)}.com/{rng.choice(WORDS)} external link]'
+      if rng.random() < 0.02:
+        words += ' [[Broken link' # Deliberate mismatch, for the mismatched report
+      lines.append(words)
+    lines += [f'[[{link}]]' for link in self.links(title)]
+    lines += [f'[[{category}]]' for category in self.page_categories(title)]
+    return '\n\n'.join(lines)
+
+  def html(self, title):
+    rng = self.rng(title + '#html')
+    body = ''.join(f'<p>{line}</p>\n' for line in self.text(title).split('\n\n'))
+    for _ in range(rng.randint(0, 5)):
+      body += f'<a rel="nofollow" class="external text" href="https://example-{rng.randint(0, 500)}.com/{rng.choice(WORDS)}">link</a>\n'
+    if rng.random() < 0.01:
+      body += f'<span class="error">Warning: Display title "{title}" overrides earlier display title "{title}".</span>\n'
+    return f'<!DOCTYPE html>\n<html><head><title>{title} - Team Fortress Wiki</title></head><body>\n{SKIN}<div id="content">\n{body}</div></body></html>'
+
+  def build_indices(self):
+    with self.lock:
+      if self.transclusions is not None:
+        return
+      transclusions = {}
+      category_members = {}
+      for titles in self.titles.values():
+        for title in titles:
+          for template in self.templates(title):
+            transclusions.setdefault(template, []).append(title)
+          for category in self.page_categories(title):
+            category_members.setdefault(category, []).append(title)
+      self.category_members = category_members
+      self.transclusions = transclusions
+
+  def embeddedin(self, title):
+    self.build_indices()
+    return self.transclusions.get(title, [])
+
+  def members(self, category):
+    self.build_indices()
+    return self.category_members.get(category, [])
+
+  def recent_changes(self, start):
+    rng = Random(self.seed)
+    articles = self.titles[0]
+    changes = []
+    for title in rng.sample(articles, min(len(articles), max(1, len(articles) // 200))):
+      timestamp = (self.now - timedelta(days=rng.random() * 7)).strftime(r'%Y-%m-%dT%H:%M:%SZ')
+      changes.append({'type': 'edit', 'ns': 0, 'title': title, 'revid': self.revid(title), 'timestamp': timestamp})
+    for title, (revid, _) in list(self.edits.items()):
+      changes.append({'type': 'edit', 'ns': self.namespace(title), 'title': title, 'revid': revid, 'timestamp': self.now.strftime(r'%Y-%m-%dT%H:%M:%SZ')})
+    return sorted((change for change in changes if change['timestamp'] >= start), key=lambda change: change['timestamp'])
+
+  def users(self):
+    rng = Random(self.seed)
+    users = []
+    for i in range(max(10, len(self.all_titles) // 20)):
+      registration = datetime(2010, 6, 1) + timedelta(days=rng.random() * 365 * 10)
+      users.append({'userid': i + 1, 'name': f'User {i}', 'editcount': int(rng.paretovariate(0.8)), 'registration': registration.strftime(r'%Y-%m-%dT%H:%M:%SZ')})
+    return users
+
+  def edit(self, title, text):
+    with self.lock:
+      old_revid = self.revid(title) if self.exists(title) else 0
+      if self.exists(title) and self.text(title) == text:
+        return old_revid, None
+      new_revid = max(old_revid, 10_000_000) + 1
+      self.edits[title] = (new_revid, text)
+      if title not in self.all_titles:
+        self.all_titles.add(title)
+        titles = self.titles[self.namespace(title)]
+        titles.insert(bisect_left(titles, title), title)
+      return old_revid, new_revid
+
+  def delete(self, title):
+    with self.lock:
+      if title not in self.all_titles:
+        return False
+      self.all_titles.remove(title)
+      self.titles[self.namespace(title)].remove(title)
+      self.edits.pop(title, None)
+      return True
+
+
+
+class FakeApi:
+  """Implements the subset of api.php and index.php which wikitools and the reports use."""
+
+  def __init__(self, wiki):
+    self.wiki = wiki
+    self.csrf_token = 'fakecsrf+\\' # Change this to expire the clients' tokens
+
+  def page_entry(self, title, props, params):
+    w = self.wiki
+    ns = w.namespace(title)
+    if not w.exists(title):
+      return {'ns': ns, 'title': title, 'missing': ''}
+    entry = {'pageid': crc32(title.encode('utf-8')), 'ns': ns, 'title': title}
+    if 'info' in props:
+      entry.update(touched=w.timestamp(title), lastrevid=w.revid(title), length=len(w.text(title)))
+      if w.is_redirect(title):
+        entry['redirect'] = ''
+    if 'revisions' in props:
+      revision = {'revid': w.revid(title)}
+      rvprop = params.get('rvprop', 'ids|timestamp|flags|comment|user')
+      if 'content' in rvprop:
+        text = w.text(title)
+        if params.get('rvsection') == '0': # Everything before the first heading
+          heading = search('^=', text, MULTILINE)
+          text = text[:heading.start()] if heading else text
+        revision['slots'] = {'main': {'contentmodel': 'wikitext', 'contentformat': 'text/x-wiki', '*': text}}
+      if 'sha1' in rvprop:
+        revision['sha1'] = sha1(w.text(title).encode('utf-8')).hexdigest()
+      if 'comment' in rvprop:
+        revision['comment'] = ''
+      entry['revisions'] = [revision]
+    if 'links' in props:
+      namespaces = params.get('plnamespace')
+      links = [{'ns': w.namespace(link), 'title': link} for link in w.links(title)]
+      entry['links'] = [link for link in links if not namespaces or str(link['ns']) in namespaces.split('|')]
+    if 'templates' in props:
+      entry['templates'] = [{'ns': 10, 'title': template} for template in w.templates(title)]
+    if 'categories' in props:
+      entry['categories'] = [{'ns': 14, 'title': category} for category in w.page_categories(title)]
+    if 'duplicatefiles' in props and crc32(title.encode('utf-8')) % 50 == 0:
+      entry['duplicatefiles'] = [{'name': title.partition(':')[2].replace(' ', '_').replace('.png', ' copy.png'), 'shared': ''}]
+    return entry
+
+  def paginate(self, titles, prefix, params, limit_default=10):
+    limit = params.get(prefix + 'limit', limit_default)
+    limit = 500 if limit == 'max' else int(limit)
+    start = int(params.get(prefix + 'continue', 0))
+    page = titles[start:start + limit]
+    more = start + limit < len(titles)
+    return page, ({prefix + 'continue': str(start + limit)} if more else None)
+
+  def list_pages(self, params, prefix):
+    w = self.wiki
+    namespaces = str(params.get(prefix + 'namespace', 0)).split('|')
+    redirect_filter = params.get(prefix + 'filterredir', 'all')
+    titles = []
+    for namespace in namespaces:
+      titles += w.titles.get(int(namespace), [])
+    if redirect_filter == 'redirects':
+      titles = [title for title in titles if w.is_redirect(title)]
+    elif redirect_filter == 'nonredirects':
+      titles = [title for title in titles if not w.is_redirect(title)]
+    if params.get(prefix + 'prefix'):
+      titles = [title for title in titles if title.partition(':')[2].startswith(params[prefix + 'prefix'])]
+    return titles
+
+  def query(self, params):
+    w = self.wiki
+    result = {}
+    cont = None
+
+    if params.get('meta') == 'siteinfo':
+      namespaces = {str(ns): {'id': ns, 'case': 'first-letter', '*': name} for name, ns in NAMESPACES.items()}
+      for ns, canonical in CANONICAL_NAMESPACES.items():
+        namespaces[str(ns)]['canonical'] = canonical
+      return {'batchcomplete': '', 'query': {'namespaces': namespaces}}
+    if params.get('meta') == 'tokens':
+      return {'batchcomplete': '', 'query': {'tokens': {'csrftoken': self.csrf_token, 'logintoken': 'fakelogin+\\'}}}
+
+    props = set(params.get('prop', '').split('|')) - {''}
+    titles = None
+    generator = params.get('generator')
+    if generator == 'allpages':
+      titles, cont = self.paginate(self.list_pages(params, 'gap'), 'gap', params)
+    elif generator == 'allimages':
+      titles, cont = self.paginate(w.titles[NAMESPACES['File']], 'gai', params)
+    elif generator == 'links':
+      links = []
+      for title in params['titles'].replace('_', ' ').split('|'):
+        links += w.links(title) if w.exists(title) else []
+      namespaces = params.get('gplnamespace')
+      links = [link for link in links if not namespaces or str(w.namespace(link)) in str(namespaces).split('|')]
+      titles, cont = self.paginate(sorted(set(links)), 'gpl', params)
+    elif 'titles' in params:
+      titles = params['titles'].replace('_', ' ').split('|')
+
+    if titles is not None:
+      pages = {}
+      for i, title in enumerate(titles):
+        entry = self.page_entry(title, props, params)
+        pages[str(entry.get('pageid', -1 - i))] = entry
+      result['pages'] = pages
+
+    list_name = params.get('list')
+    if list_name == 'allpages':
+      titles, cont = self.paginate(self.list_pages(params, 'ap'), 'ap', params)
+      result['allpages'] = [{'pageid': crc32(title.encode('utf-8')), 'ns': w.namespace(title), 'title': title} for title in titles]
+    elif list_name == 'embeddedin':
+      namespaces = str(params.get('einamespace', '*')).split('|')
+      titles = [title for title in w.embeddedin(params['eititle'].replace('_', ' ')) if '*' in namespaces or str(w.namespace(title)) in namespaces]
+      titles, cont = self.paginate(titles, 'ei', params)
+      result['embeddedin'] = [{'pageid': crc32(title.encode('utf-8')), 'ns': w.namespace(title), 'title': title} for title in titles]
+    elif list_name == 'categorymembers':
+      namespaces = str(params.get('cmnamespace', '*')).split('|')
+      titles = [title for title in w.members(params['cmtitle'].replace('_', ' ')) if '*' in namespaces or str(w.namespace(title)) in namespaces]
+      titles, cont = self.paginate(titles, 'cm', params)
+      result['categorymembers'] = [{'ns': w.namespace(title), 'title': title} for title in titles]
+    elif list_name == 'recentchanges':
+      changes, cont = self.paginate(w.recent_changes(params.get('rcstart', '')), 'rc', params)
+      result['recentchanges'] = changes
+    elif list_name == 'logevents':
+      result['logevents'] = []
+    elif list_name == 'allusers':
+      result['allusers'], cont = self.paginate(w.users(), 'au', params)
+
+    response = {'query': result}
+    if cont:
+      cont['continue'] = '-||'
+      response['continue'] = cont
+    else:
+      response['batchcomplete'] = ''
+    return response
+
+  def api(self, params):
+    w = self.wiki
+    action = params.get('action')
+    if action == 'query':
+      return self.query(params)
+    elif action == 'parse':
+      title = params['page'].replace('_', ' ')
+      if not w.exists(title):
+        return {'error': {'code': 'missingtitle', 'info': "The page you specified doesn't exist."}}
+      return {'parse': {'title': title, 'pageid': crc32(title.encode('utf-8')), 'revid': w.revid(title), 'wikitext': {'*': w.text(title)}}}
+    elif action in ('edit', 'delete', 'upload', 'emailuser') and params.get('token') != self.csrf_token:
+      return {'error': {'code': 'badtoken', 'info': 'Invalid CSRF token.'}}
+    elif action == 'login':
+      return {'login': {'result': 'Success', 'lguserid': 1, 'lgusername': params.get('lgname')}}
+    elif action == 'edit':
+      title = params['title'].replace('_', ' ')
+      old_revid, new_revid = w.edit(title, params.get('text', '').rstrip()) # Mediawiki trims trailing whitespace
+      if new_revid is None:
+        return {'edit': {'result': 'Success', 'title': title, 'nochange': ''}}
+      edit = {'result': 'Success', 'title': title, 'oldrevid': old_revid, 'newrevid': new_revid}
+      if old_revid == 0:
+        edit['new'] = ''
+      return {'edit': edit}
+    elif action == 'delete':
+      title = params['title'].replace('_', ' ')
+      if not w.delete(title):
+        return {'error': {'code': 'missingtitle', 'info': "The page you specified doesn't exist."}}
+      return {'delete': {'title': title, 'reason': params.get('reason', '')}}
+    elif action == 'upload':
+      return {'upload': {'result': 'Success', 'filename': params.get('filename')}}
+    elif action == 'emailuser':
+      return {'emailuser': {'result': 'Success'}}
+    return {'error': {'code': 'badvalue', 'info': f'Unrecognized value for parameter "action": {action}.'}}
+
+  def index(self, params, request_headers={}):
+    # Returns (status, body, response headers)
+    w = self.wiki
+    title = params.get('title', '').replace('_', ' ')
+    offset, limit = int(params.get('offset', 0)), int(params.get('limit', 50))
+    if title == 'Special:UnusedFiles':
+      files = [title for title in w.titles[NAMESPACES['File']] if crc32(title.encode('utf-8')) % 10 == 0][offset:offset + limit]
+      if not files:
+        return 200, 'There are no results for this report.', {}
+      return 200, ''.join(f'<li class="gallerybox"><img alt="{file.partition(":")[2]}" src="/w/images/{file}"></li>\n' for file in files), {}
+    elif title == 'Special:WantedTemplates':
+      if offset > 0:
+        return 200, 'There are no results for this report.', {}
+      return 200, ''.join(f'<li><a href="/w/index.php?title=Template:Missing_{i}&amp;action=edit&amp;redlink=1" class="new" title="Template:Missing {i} (page does not exist)">Template:Missing {i}</a></li>\n' for i in range(21)), {}
+    elif title == 'Special:WhatLinksHere':
+      count = crc32(params.get('target', '').encode('utf-8')) % 20
+      return 200, '<ul>' + '<li><a href="/wiki/X">X</a> <span class="mw-whatlinkshere-tools">(links | edit)</span></li>' * count + '</ul>', {}
+    elif not w.exists(title):
+      return 404, f'<html><body>There is currently no text in this page: {title}</body></html>', {}
+    # Page views can be revalidated, like MediaWiki's (which sends Last-Modified based on when the page was touched).
+    headers = {'ETag': f'"{w.revid(title)}-{w.timestamp(title)}"', 'Last-Modified': format_datetime(w.touched(title).replace(tzinfo=timezone.utc), usegmt=True)}
+    if request_headers.get('If-None-Match') == headers['ETag']:
+      return 304, '', headers
+    return 200, w.html(title), headers
+
+
+class FakeWikiServer:
+  """
+  Serves a SyntheticWiki over HTTP on localhost, with optional latency and failure injection:
+  - latency: mean seconds of delay per request
+  - error_rate: fraction of requests which fail with a 502 or 503
+  - max_concurrency: requests beyond this many in flight are rejected with a 503 and Retry-After
+  - rate_limit: requests per second, beyond which requests are rejected with a 429 and Retry-After
+  """
+
+  def __init__(self, wiki, *, host='127.0.0.1', port=0, latency=0, error_rate=0, max_concurrency=None, rate_limit=None):
+    self.api = FakeApi(wiki)
+    self.latency = latency
+    self.error_rate = error_rate
+    self.max_concurrency = max_concurrency
+    self.rate_limit = rate_limit
+
+    self.lock = Lock()
+    self.rng = Random(0)
+    self.in_flight = 0
+    self.window = (0, 0) # (second, requests in that second)
+    self.request_count = 0
+    self.bytes_sent = 0
+    self.errors = 0
+
+    server = self
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1' # Keep-alive
+
+      def log_message(self, *args):
+        pass
+
+      def do_GET(self):
+        url = urlparse(self.path)
+        server.handle(self, url.path, dict(parse_qsl(url.query)))
+
+      def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+          message = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+          params = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True).decode('utf-8', 'replace') for part in message.get_payload()}
+        else:
+          params = dict(parse_qsl(body.decode('utf-8')))
+        server.handle(self, url.path, params)
+
+    self.httpd = ThreadingHTTPServer((host, port), Handler)
+    self.httpd.daemon_threads = True
+    self.api_url = f'http://{host}:{self.httpd.server_address[1]}/w/api.php'
+
+  def start(self):
+    Thread(target=self.httpd.serve_forever, daemon=True).start()
+    return self
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, exc_type, exc_val, traceback):
+    self.stop()
+
+  def handle(self, handler, path, params):
+    with self.lock:
+      self.request_count += 1
+      self.in_flight += 1
+      second = int(monotonic())
+      self.window = (second, self.window[1] + 1) if self.window[0] == second else (second, 1)
+      overloaded = self.max_concurrency and self.in_flight > self.max_concurrency
+      rate_limited = self.rate_limit and self.window[1] > self.rate_limit
+      failed = self.rng.random() < self.error_rate
+    try:
+      self.respond(handler, path, params, overloaded, rate_limited, failed)
+    finally:
+      with self.lock:
+        self.in_flight -= 1
+
+  def respond(self, handler, path, params, overloaded, rate_limited, failed):
+    try:
+      if self.latency:
+        sleep(self.latency * self.rng.uniform(0.5, 1.5))
+
+      headers = {}
+      if rate_limited:
+        status, body, headers = 429, 'Too many requests', {'Retry-After': '1'}
+      elif overloaded:
+        status, body, headers = 503, 'Service unavailable', {'Retry-After': '1'}
+      elif failed:
+        status, body = self.rng.choice([502, 503]), 'Bad gateway'
+      elif path.endswith('api.php'):
+        status, body = 200, dumps(self.api.api(params))
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+      elif path.endswith('index.php'):
+        status, body, headers = self.api.index(params, handler.headers)
+        headers['Content-Type'] = 'text/html; charset=utf-8'
+      else:
+        status, body = 404, 'Not found'
+    except Exception as e:
+      status, body, headers = 500, f'Internal error: {e!r}', {}
+
+    data = body.encode('utf-8')
+    handler.send_response(status)
+    for key, value in headers.items():
+      handler.send_header(key, value)
+    handler.send_header('Content-Length', str(len(data)))
+    handler.end_headers()
+    handler.wfile.write(data)
+    with self.lock:
+      self.bytes_sent += len(data)
+      self.errors += status >= 400
+
+
+if __name__ == '__main__':
+  # Usage: python -m wikitools.fake_wiki --pages 100000 --port 8080
+  # Then run reports with WIKI_API_URL=http://127.0.0.1:8080/w/api.php
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description='Serve a synthetic wiki for load testing wikitools and the reports')
+  parser.add_argument('--pages', type=int, default=10000)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--latency', type=float, default=0, help='Mean seconds of delay per request')
+  parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests which fail with 502/503')
+  parser.add_argument('--max-concurrency', type=int, default=None, help='Reject requests beyond this many in flight with a 503')
+  parser.add_argument('--rate-limit', type=int, default=None, help='Reject requests beyond this many per second with a 429')
+  args = parser.parse_args()
+
+  print(f'Generating a wiki with {args.pages} pages...')
+  wiki = SyntheticWiki(args.pages, seed=args.seed)
+  server = FakeWikiServer(wiki, port=args.port, latency=args.latency, error_rate=args.error_rate,
+                          max_concurrency=args.max_concurrency, rate_limit=args.rate_limit)
+  print(f'Serving {len(wiki.all_titles)} pages at {server.api_url}')
+  try:
+    server.httpd.serve_forever()
+  except KeyboardInterrupt:
+    print(f'Served {server.request_count} requests ({server.bytes_sent:_} bytes, {server.errors} errors)')
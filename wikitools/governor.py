@@ -0,0 +1,73 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from threading import Condition
+from time import monotonic
+
+class Governor:
+  """
+  Shared concurrency control for every request to a wiki.
+  The number of requests in flight follows AIMD: each success raises the limit a little, and each overload
+  (429/502/503, maxlag) halves it. Overloads also pause *all* requests until the server's Retry-After has passed,
+  and repeated overloads lengthen that pause (a circuit breaker), so that threads don't back off independently
+  and then stampede back all at once.
+  """
+
+  def __init__(self, *, max_in_flight=50, min_backoff=5, max_backoff=300):
+    self.max_in_flight = max_in_flight
+    self.limit = float(max_in_flight)
+    self.in_flight = 0
+    self.min_backoff = min_backoff
+    self.max_backoff = max_backoff
+    self.consecutive_overloads = 0
+    self.paused_until = 0
+    self.condition = Condition()
+
+  def acquire(self):
+    with self.condition:
+      while True:
+        pause = self.paused_until - monotonic()
+        if pause > 0:
+          self.condition.wait(pause)
+        elif self.in_flight >= int(self.limit):
+          self.condition.wait()
+        else:
+          break
+      self.in_flight += 1
+
+  def try_acquire(self):
+    # Like acquire, but returns False instead of waiting (e.g. for asyncio tasks, which mustn't block their thread).
+    with self.condition:
+      if self.paused_until > monotonic() or self.in_flight >= int(self.limit):
+        return False
+      self.in_flight += 1
+      return True
+
+  def release(self, *, overloaded=False, retry_after=None):
+    with self.condition:
+      self.in_flight -= 1
+      now = monotonic()
+      if not overloaded:
+        self.consecutive_overloads = 0
+        self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+      elif now >= self.paused_until:
+        # Only react once per overload. Other requests which were already in flight will also fail,
+        # but they don't tell us anything new about the server's capacity.
+        self.consecutive_overloads += 1
+        self.limit = max(1, self.limit / 2)
+        backoff = min(self.max_backoff, self.min_backoff * 2 ** (self.consecutive_overloads - 1))
+        self.paused_until = now + max(backoff, retry_after or 0)
+        print(f'Server is overloaded, pausing all requests for {self.paused_until - now:.0f} seconds (max {int(self.limit)} in flight)')
+      self.condition.notify_all()
+
+def parse_retry_after(value):
+  """Parse a Retry-After header, which is either a number of seconds or an HTTP date."""
+  if not value:
+    return None
+  try:
+    return float(value)
+  except ValueError:
+    pass
+  try:
+    return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+  except (TypeError, ValueError):
+    return None
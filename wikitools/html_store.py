@@ -0,0 +1,53 @@
+import zlib
+from os import makedirs, path
+from sqlite3 import connect
+from threading import Lock
+
+from .tracing import tracer
+
+class HtmlStore:
+  """
+  Rendered page HTML, kept between runs in the cache directory, along with what we need to tell whether it's still
+  current: the page's touched timestamp and revision ID (from page info), and the ETag and Last-Modified headers of
+  the response (for conditional requests). See Page.get_raw_html.
+  """
+
+  def __init__(self, cache_dir):
+    makedirs(cache_dir, exist_ok=True)
+    self.lock = Lock()
+    self.db = connect(path.join(cache_dir, 'html.sqlite3'), check_same_thread=False, isolation_level=None)
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.execute('PRAGMA synchronous=NORMAL')
+    self.db.execute('CREATE TABLE IF NOT EXISTS pages (title TEXT PRIMARY KEY, touched TEXT, revid INTEGER, etag TEXT, last_modified TEXT, html BLOB)')
+
+  def get(self, title):
+    with tracer.locked(self.lock, 'html store'):
+      row = self.db.execute('SELECT touched, revid, etag, last_modified, html FROM pages WHERE title = ?', (title,)).fetchone()
+    if row is None:
+      return None
+    touched, revid, etag, last_modified, html = row
+    return {
+      'touched': touched,
+      'revid': revid,
+      'etag': etag,
+      'last_modified': last_modified,
+      'html': zlib.decompress(html).decode('utf-8'),
+    }
+
+  def set(self, title, html, *, touched=None, revid=None, etag=None, last_modified=None):
+    data = zlib.compress(html.encode('utf-8'), 6)
+    with tracer.locked(self.lock, 'html store'):
+      self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)', (title, touched, revid, etag, last_modified, data))
+
+  def touch(self, title, touched, revid=None):
+    # The server confirmed that the stored HTML is current, so remember the newer timestamp to skip the next request.
+    with tracer.locked(self.lock, 'html store'):
+      self.db.execute('UPDATE pages SET touched = ?, revid = COALESCE(?, revid) WHERE title = ?', (touched, revid, title))
+
+  def discard(self, title):
+    with tracer.locked(self.lock, 'html store'):
+      self.db.execute('DELETE FROM pages WHERE title = ?', (title,))
+
+  def __len__(self):
+    with tracer.locked(self.lock, 'html store'):
+      return self.db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from json import dump
+from math import floor, log2
+from threading import Lock
+
+# The report (or other unit of work) which requests are currently being made for. Threads which do work for a report
+# need to run in a copy of its context, see utils.pagescraper_queue.
+current_scope = ContextVar('current_scope', default=None)
+
+# Latency buckets are a quarter power of two wide (about 19%), so percentiles are accurate to within that.
+BUCKETS_PER_DOUBLING = 4
+
+def endpoint_name(url, params):
+  """A low-cardinality name for a request, e.g. 'query list=allpages' or 'index.php Special:UnusedFiles'"""
+  if url.endswith('index.php'):
+    title = params.get('title', '')
+    return 'index.php ' + (title.split('/')[0] if title.startswith('Special:') else 'page')
+  name = params.get('action', url)
+  for key in ['list', 'prop', 'generator', 'meta']:
+    if key in params:
+      name += f' {key}={params[key]}'
+  return name
+
+class Histogram:
+  def __init__(self):
+    self.count = 0
+    self.statuses = {}
+    self.bytes = 0
+    self.retries = 0
+    self.latency = 0
+    self.wait = 0
+    self.buckets = {}
+
+  def add(self, status, latency, size, retry, wait):
+    self.count += 1
+    self.statuses[status] = self.statuses.get(status, 0) + 1
+    self.bytes += size
+    self.retries += retry
+    self.latency += latency
+    self.wait += wait
+    bucket = floor(log2(max(latency, 0.001)) * BUCKETS_PER_DOUBLING)
+    self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+  def percentile(self, p):
+    remaining = self.count * p
+    for bucket in sorted(self.buckets):
+      remaining -= self.buckets[bucket]
+      if remaining <= 0:
+        return 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING) # Upper edge of the bucket
+    return 0
+
+  def snapshot(self):
+    return {
+      'requests': self.count,
+      'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+      'bytes': self.bytes,
+      'retries': self.retries,
+      'latency_total': round(self.latency, 3),
+      'latency_p50': round(self.percentile(0.50), 3),
+      'latency_p95': round(self.percentile(0.95), 3),
+      'wait_total': round(self.wait, 3),
+    }
+
+class Metrics:
+  """
+  Per-endpoint statistics for every HTTP request made by a Wiki: status codes, response sizes, retries,
+  a latency histogram, and time spent waiting for the governor (i.e. on rate limits) before the request was sent.
+  Requests are also tallied for the current scope (see scope()), so that they can be attributed to a report.
+  """
+
+  def __init__(self):
+    self.lock = Lock()
+    self.endpoints = {}
+
+  def record(self, endpoint, *, status, latency, size, retry=False, wait=0):
+    scope = current_scope.get()
+    keys = [(None, endpoint), (None, None)]
+    if scope:
+      keys += [(scope, endpoint), (scope, None)]
+    with self.lock:
+      for key in keys:
+        if key not in self.endpoints:
+          self.endpoints[key] = Histogram()
+        self.endpoints[key].add(status, latency, size, retry, wait)
+
+  @contextmanager
+  def scope(self, name):
+    token = current_scope.set(name)
+    try:
+      yield
+    finally:
+      current_scope.reset(token)
+
+  def snapshot(self, scope=None):
+    """Statistics for each endpoint (and a 'total'), either for the whole run or for just one scope."""
+    with self.lock:
+      snapshot = {endpoint or 'total': histogram.snapshot() for (s, endpoint), histogram in self.endpoints.items() if s == scope}
+    if 'total' not in snapshot:
+      snapshot['total'] = Histogram().snapshot()
+    return snapshot
+
+  def summary(self, scope=None):
+    total = self.snapshot(scope)['total']
+    return f'{total["requests"]:,} requests, {total["bytes"] / 1e6:.1f} MB, p50 {total["latency_p50"]:.2f}s, p95 {total["latency_p95"]:.2f}s, {total["retries"]} retries'
+
+  def dump(self, file_name):
+    with self.lock:
+      scopes = {s for s, _ in self.endpoints if s}
+    with open(file_name, 'w', encoding='utf-8') as f:
+      dump({'run': self.snapshot(), 'scopes': {s: self.snapshot(s) for s in sorted(scopes)}}, f, indent=2, sort_keys=True)
@@ -1,19 +1,38 @@
+from hashlib import sha1
+from re import compile
+from sys import intern
 from time import sleep
+from unicodedata import normalize
 import functools
 import requests
 
+# Translated pages are subpages named after their language, e.g. Scout/fr. Each code maps to one shared (interned)
+# string, so that the lang of every page is the same object, and a page's language is a single dict lookup.
+LANGS = {intern(lang): intern(lang) for lang in 'ar cs da de es fi fr hu it ja ko nl no pl pt pt-br ro ru sv tr zh-hans zh-hant'.split(' ')}
+
+# Reports say when they were generated (see utils.time_and_date), which is the only part of them that changes every run.
+DATA_AS_OF = compile('Data (?:accurate )?as of ([^.\n]+)')
+
 @functools.total_ordering
 class Page:
+  # Reports hold 100k+ pages at once, so pages don't get a __dict__.
+  __slots__ = ('wiki', 'title', 'url_title', 'raw', 'basename', 'lang', 'sort_key')
+
   def __init__(self, wiki, title, raw=None):
     self.wiki = wiki
     self.title = title
     self.url_title = title.replace(' ', '_')
-    self.raw = raw
+    self.raw = raw # The API entry which this page came from (if any), which may include e.g. links or revision IDs
 
-    self.basename, _, self.lang = title.rpartition('/')
-    if self.lang not in 'ar cs da de es fi fr hu it ja ko nl no pl pt pt-br ro ru sv tr zh-hans zh-hant'.split(' '):
+    basename, _, lang = title.rpartition('/')
+    self.lang = LANGS.get(lang)
+    if self.lang:
+      self.basename = basename
+    else:
       self.basename = title
       self.lang = 'en'
+    # English first, then the other languages alphabetically, then by title. Computed once, since pages get sorted a lot.
+    self.sort_key = (self.lang != 'en', self.lang, self.url_title)
 
   def __str__(self):
     return self.title
@@ -21,10 +40,11 @@ class Page:
   def __repr__(self):
     return f'Page(w, {self.title})'
 
+  def __lt__(self, other):
+    return self.sort_key < other.sort_key
+
   def __le__(self, other):
-    if self.lang == other.lang:
-      return self.url_title <= other.url_title
-    return self.lang == 'en' or (other.lang != 'en' and self.lang < other.lang)
+    return self.sort_key <= other.sort_key
 
   def __eq__(self, other):
     try:
@@ -41,16 +61,18 @@ class Page:
     return '|'.join((str(self.wiki.namespaces[ns]) for ns in namespaces))
 
   def get_wiki_text(self):
-    cached_text = self.wiki.page_text_cache.get(self.title, None)
+    # If we already know which revision this page is at (e.g. from recent changes), don't accept older cached text.
+    revid = (self.raw.get('lastrevid') or self.raw.get('revid')) if self.raw else None
+    cached_text = self.wiki.page_text_cache.get(self.title, None, revid=revid)
     if cached_text:
       return cached_text
     try:
-      raw = self.wiki.get('parse', page=self.url_title, prop='wikitext')
+      raw = self.wiki.get('parse', page=self.url_title, prop='wikitext|revid')
       if 'error' in raw:
         print(f'Error while fetching {self.url_title} contents: ' + str(raw['error']))
         return '' # Unable to fetch page contents, pretend it's empty
       text = raw['parse']['wikitext']['*']
-      self.wiki.page_text_cache[self.title] = text
+      self.wiki.page_text_cache.set(self.title, text, raw['parse'].get('revid'))
       return text
     except requests.exceptions.RequestException:
       return '' # Unable to fetch page contents, pretend it's empty
@@ -59,13 +81,42 @@ class Page:
     cached_html = self.wiki.page_html_cache.get(self.title, None)
     if cached_html:
       return cached_html
+
+    # With a cache directory, HTML is kept between runs. If the page hasn't been touched (edited, or re-rendered because
+    # a template changed) since we stored it, we don't need to ask. Otherwise, the server only resends it if it changed.
+    stored = self.wiki.html_store.get(self.title) if self.wiki.html_store is not None else None
+    touched = self.raw.get('touched') if self.raw else None
+    revid = self.raw.get('lastrevid') if self.raw else None
+    if stored and touched and stored['touched'] == touched:
+      self.wiki.page_html_cache[self.title] = stored['html']
+      return stored['html']
+
+    headers = {}
+    if stored and stored['etag']:
+      headers['If-None-Match'] = stored['etag']
+    if stored and stored['last_modified']:
+      headers['If-Modified-Since'] = stored['last_modified']
     try:
-      r = requests.get(self.wiki.wiki_url, allow_redirects=True, params={'title': self.url_title})
-      self.wiki.page_html_cache[self.title] = r.text
-      return r.text
+      r = self.wiki.transport.get(self.wiki.wiki_url, allow_redirects=True, params={'title': self.url_title}, headers=headers)
     except requests.exceptions.RequestException:
       return '' # Unable to fetch page contents, pretend it's empty
 
+    if r.status_code == 304 and stored:
+      html = stored['html']
+      if touched:
+        self.wiki.html_store.touch(self.title, touched, revid)
+    else:
+      html = r.text
+      if self.wiki.html_store is not None and r.status_code == 200:
+        self.wiki.html_store.set(self.title, html,
+          touched=touched,
+          revid=revid,
+          etag=r.headers.get('ETag'),
+          last_modified=r.headers.get('Last-Modified'),
+        )
+    self.wiki.page_html_cache[self.title] = html
+    return html
+
   def get_page_url(self, **kwargs):
     params = ''.join([f'&{key}={value}' for key, value in kwargs.items()])
     url = f'{self.wiki.wiki_url}?title={self.url_title}{params}'
@@ -96,6 +147,19 @@ class Page:
     ):
       yield Page(self.wiki, entry['title'], entry)
 
+  def get_subpages(self):
+    namespace, colon, title = self.title.partition(':')
+    if not colon or namespace not in self.wiki.namespaces:
+      namespace, title = 'Main', self.title
+    # Not memoized (unlike other page lists), since reports add and remove their own subpages during a run
+    for entry in self.wiki.fetch_with_continue('query', 'allpages',
+      list='allpages',
+      apnamespace=self.wiki.namespaces[namespace],
+      apprefix=title + '/',
+      aplimit=500,
+    ):
+      yield Page(self.wiki, entry['title'], entry)
+
   def get_file_link_count(self):
     # Unfortunately, the mediawiki APIs don't include file links, so we have to scrape the HTML.
     for html in self.wiki.get_html_with_continue('Special:WhatLinksHere',
@@ -111,6 +175,11 @@ class Page:
     if len(text) > 3000 * 1000: # 3 KB
       text = '<span class="error">Warning: Report truncated to 3 KB</span>\n' + text[:3000 * 1000]
 
+    revid = self.get_unchanged_revid(text)
+    if revid:
+      print(f'No change to {self.title}')
+      return self.wiki.wiki_url + '?oldid=' + str(revid)
+
     try:
       data = self.wiki.post_with_csrf('edit',
         title=self.url_title,
@@ -135,11 +204,59 @@ class Page:
       return self.wiki.wiki_url + '?diff=' + str(data['edit']['newrevid'])
     elif 'nochange' in data['edit']:
       print(f'No change to {self.title}')
-      return None
+      return self.get_page_url() # Not a failure, there's just no diff to link to
     else:
       print(f'Successfully edited {self.title}')
       return self.wiki.wiki_url + '?diff=' + str(data['edit']['newrevid'])
 
+  def get_unchanged_revid(self, text):
+    # Returns the current revision ID if this page's text is already the same as text (apart from when it was generated),
+    # so that unchanged reports don't need to be uploaded again. The current revision's sha1 is compared against,
+    # so we only need its first section, which is where reports put their timestamp.
+    try:
+      data = self.wiki.get('query',
+        prop='revisions',
+        titles=self.url_title,
+        rvprop='ids|sha1|content',
+        rvslots='main',
+        rvsection=0,
+      )
+    except requests.exceptions.RequestException:
+      return None
+    for entry in data.get('query', {}).get('pages', {}).values():
+      if not entry.get('revisions'):
+        return None # Page doesn't exist yet
+      revision = entry['revisions'][0]
+      old_date = DATA_AS_OF.search(revision['slots']['main']['*'])
+      new_date = DATA_AS_OF.search(text)
+      if old_date and new_date:
+        text = text[:new_date.start(1)] + old_date[1] + text[new_date.end(1):]
+      # Mediawiki normalizes text when saving it, which is reflected in the sha1
+      text = normalize('NFC', text.replace('\r\n', '\n')).rstrip()
+      if sha1(text.encode('utf-8')).hexdigest() == revision.get('sha1'):
+        return revision['revid']
+    return None
+
+  def delete(self, reason):
+    try:
+      data = self.wiki.post_with_csrf('delete',
+        title=self.url_title,
+        reason=reason,
+      )
+    except Exception as e:
+      print(f'Failed to delete {self.title}:\n{e}')
+      return False
+
+    if 'error' in data:
+      if isinstance(data['error'], dict) and data['error'].get('code') == 'missingtitle':
+        print(f'{self.title} was already deleted')
+        return True
+      print(f'Failed to delete {self.title}:')
+      print(data['error'])
+      return False
+    print(f'Successfully deleted {self.title}')
+    return True
+
   def upload(self, fileobj, comment=''):
     if not self.title.startswith('File:'):
       print(f'WARNING: Page title "{self.title}" is not in the file namespace, page edits will not work properly')
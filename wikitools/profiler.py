@@ -0,0 +1,121 @@
+import marshal
+import sys
+import time
+import tracemalloc
+from os import path
+from threading import Event, Thread, get_ident
+
+# Threads whose innermost frame is in one of these are waiting (for work, a lock, or the network), not using the CPU.
+WAITING_MODULES = {'threading.py', 'queue.py', 'selectors.py', 'socket.py', 'ssl.py'}
+
+class Profiler:
+  """
+  Opt-in profiling for a block of code, e.g. one report. modes is a comma-separated string:
+  - 'cpu' samples the stacks of *all* threads (cProfile would only see the calling thread, but reports do most of
+    their work in pagescraper_queue threads), and writes <name>.pstats (for pstats/snakeviz) and <name>.collapsed
+    (one 'frame;frame;frame count' line per stack, for flamegraph.pl or speedscope). Threads which are blocked are
+    left out: where the OS has per-thread CPU clocks, a thread is only sampled if it used CPU since the last sample,
+    and otherwise if it isn't waiting in threading, queue or socket code.
+  - 'memory' traces allocations with tracemalloc, and writes the biggest allocation sites to <name>_allocations.log.
+  """
+
+  def __init__(self, name, modes, *, interval=0.01, top_allocations=30):
+    self.name = name
+    self.modes = {mode.strip() for mode in (modes or '').split(',') if mode.strip()}
+    if self.modes == {'1'}:
+      self.modes = {'cpu', 'memory'}
+    self.interval = interval
+    self.top_allocations = top_allocations
+    self.stacks = {}
+
+  def __enter__(self):
+    if 'memory' in self.modes:
+      tracemalloc.start(10)
+    if 'cpu' in self.modes:
+      self.done = Event()
+      self.sampler = Thread(target=self.sample, daemon=True)
+      self.sampler.start()
+    return self
+
+  def __exit__(self, exc_type, exc_val, traceback):
+    if 'cpu' in self.modes:
+      self.done.set()
+      self.sampler.join()
+      self.write_collapsed(self.name + '.collapsed')
+      self.write_pstats(self.name + '.pstats')
+    if 'memory' in self.modes:
+      snapshot = tracemalloc.take_snapshot()
+      peak = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+      self.write_allocations(self.name + '_allocations.log', snapshot, peak)
+
+  def sample(self):
+    own_thread = get_ident()
+    cpu_times = {} # thread id: CPU time at the last sample
+    while not self.done.wait(self.interval):
+      for thread_id, frame in sys._current_frames().items():
+        if thread_id == own_thread:
+          continue
+        if not self.is_running(thread_id, frame, cpu_times):
+          continue
+        stack = []
+        while frame:
+          code = frame.f_code
+          stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+          frame = frame.f_back
+        stack = tuple(reversed(stack)) # Outermost frame first
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+  def is_running(self, thread_id, frame, cpu_times):
+    try:
+      cpu_time = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError): # No per-thread CPU clocks on this platform (or the thread just exited)
+      return path.basename(frame.f_code.co_filename) not in WAITING_MODULES
+    last_cpu_time = cpu_times.get(thread_id)
+    cpu_times[thread_id] = cpu_time
+    return last_cpu_time is not None and cpu_time > last_cpu_time
+
+  def write_collapsed(self, file_name):
+    with open(file_name, 'w', encoding='utf-8') as f:
+      for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+        f.write(';'.join(f'{func} ({filename}:{line})' for filename, line, func in stack) + f' {count}\n')
+    print(f'CPU samples written to {file_name}')
+
+  def write_pstats(self, file_name):
+    # Convert the samples into the format that cProfile dumps, so that the usual tools can read them.
+    # Call counts are sample counts, and times are estimated from the sampling interval.
+    stats = {} # func: [primitive calls, calls, self time, cumulative time, {caller: (calls, calls, self time, cumulative time)}]
+    for stack, count in self.stacks.items():
+      seconds = count * self.interval
+      seen = set()
+      for i, func in enumerate(stack):
+        entry = stats.setdefault(func, [0, 0, 0, 0, {}])
+        is_leaf = i == len(stack) - 1
+        if func not in seen: # Recursive functions only count once towards their cumulative time
+          seen.add(func)
+          entry[0] += count
+          entry[1] += count
+          entry[3] += seconds
+        if is_leaf:
+          entry[2] += seconds
+        if i > 0:
+          caller = entry[4].get(stack[i - 1], (0, 0, 0, 0))
+          entry[4][stack[i - 1]] = (caller[0] + count, caller[1] + count, caller[2] + (seconds if is_leaf else 0), caller[3] + seconds)
+    with open(file_name, 'wb') as f:
+      marshal.dump({func: tuple(entry) for func, entry in stats.items()}, f)
+    print(f'CPU profile written to {file_name}')
+
+  def write_allocations(self, file_name, snapshot, peak):
+    snapshot = snapshot.filter_traces([
+      tracemalloc.Filter(False, tracemalloc.__file__),
+      tracemalloc.Filter(False, __file__), # The CPU sampler's own bookkeeping
+      tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    with open(file_name, 'w', encoding='utf-8') as f:
+      f.write(f'Peak traced memory: {peak / 1e6:.1f} MB\n')
+      statistics = snapshot.statistics('traceback')
+      f.write(f'Still allocated at the end: {sum(stat.size for stat in statistics) / 1e6:.1f} MB in {sum(stat.count for stat in statistics):,} blocks\n')
+      for stat in statistics[:self.top_allocations]:
+        f.write(f'\n{stat.size / 1e6:.2f} MB in {stat.count:,} blocks\n')
+        f.write('\n'.join(stat.traceback.format(most_recent_first=True)[:10]) + '\n')
+    print(f'Allocation snapshot written to {file_name}')
@@ -0,0 +1,42 @@
+from concurrent.futures import Future
+from threading import Lock
+
+from .tracing import tracer
+
+class SingleFlight:
+  """
+  Collapses concurrent calls with the same key into one: the first caller runs the function, and callers which
+  arrive while it's still running wait for it, and get the same result (or exception).
+  Calls which arrive after it has finished run the function again, so results are never stale.
+  """
+
+  def __init__(self):
+    self.lock = Lock()
+    self.in_flight = {} # key: Future
+    self.shared = 0 # Number of calls which waited for another caller's result
+
+  def do(self, key, func, *args, **kwargs):
+    with self.lock:
+      future = self.in_flight.get(key)
+      if future is None:
+        future = self.in_flight[key] = Future()
+        leader = True
+      else:
+        self.shared += 1
+        leader = False
+
+    if not leader:
+      with tracer.span('wait for identical request', 'lock', key=str(key)):
+        return future.result()
+
+    try:
+      result = func(*args, **kwargs)
+    except BaseException as e:
+      future.set_exception(e)
+      raise
+    else:
+      future.set_result(result)
+      return result
+    finally:
+      with self.lock:
+        del self.in_flight[key]
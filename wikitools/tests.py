@@ -2,6 +2,8 @@
 import inspect
 import sys
 
+from governor import Governor
+from metrics import Metrics, endpoint_name
 from page import Page
 
 class MockWiki:
@@ -31,6 +33,48 @@ class Tests:
     actual = self.sort_titles(['Scout/ko', 'Solider/ja', 'Pyro/it', 'Demoman/hu', 'Heavy/fr', 'Engineer/de', 'Medic/cs', 'Sniper/ar', 'Spy'])
     expected = ['Spy', 'Sniper/ar', 'Medic/cs', 'Engineer/de', 'Heavy/fr', 'Demoman/hu', 'Pyro/it', 'Solider/ja', 'Scout/ko']
     assert expected == actual, f'{expected}\n{actual}'
+    pages = [Page(self.wiki, 'Scout/pt-br'), Page(self.wiki, 'Team Fortress 2/pt-br'), Page(self.wiki, 'Meet the Team/Notes')]
+    assert pages[0].lang is pages[1].lang and pages[1].basename == 'Team Fortress 2'
+    assert pages[2].lang == 'en' and pages[2].basename == 'Meet the Team/Notes'
+    assert not hasattr(pages[0], '__dict__')
+
+  def test_governor_backoff(self):
+    governor = Governor(max_in_flight=8, min_backoff=60)
+    for _ in range(3): # Three requests fail at once, but that's only one overload
+      governor.acquire()
+    for _ in range(3):
+      governor.release(overloaded=True)
+    assert governor.limit == 4, governor.limit
+    assert governor.consecutive_overloads == 1
+
+    assert not governor.try_acquire() # Paused
+    governor.paused_until = 0 # Pretend the backoff has elapsed
+    governor.acquire()
+    governor.release(overloaded=True)
+    assert governor.limit == 2, governor.limit
+
+    governor.paused_until = 0
+    for _ in range(10):
+      governor.acquire()
+      governor.release()
+    assert 2 < governor.limit < 8, governor.limit
+    assert governor.in_flight == 0
+
+  def test_metrics(self):
+    metrics = Metrics()
+    endpoint = endpoint_name('https://wiki/w/api.php', {'action': 'query', 'list': 'allpages', 'aplimit': 500})
+    assert endpoint == 'query list=allpages', endpoint
+    with metrics.scope('all_articles'):
+      for i in range(100):
+        metrics.record(endpoint, status=200, latency=0.01 * (i + 1), size=1000, retry=i >= 98)
+    metrics.record('parse', status=503, latency=1, size=0)
+
+    total = metrics.snapshot()['total']
+    assert total['requests'] == 101 and total['statuses'] == {'200': 100, '503': 1}, total
+    scoped = metrics.snapshot('all_articles')[endpoint]
+    assert scoped['requests'] == 100 and scoped['bytes'] == 100_000 and scoped['retries'] == 2, scoped
+    assert 0.5 <= scoped['latency_p50'] <= 0.5 * 1.2, scoped # Accurate to within one bucket
+    assert 0.95 <= scoped['latency_p95'] <= 0.95 * 1.2, scoped
 
 if __name__ == '__main__':
   tests = Tests()
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from os import environ, makedirs, path
+from sqlite3 import connect
+from sys import getsizeof
+from threading import Lock
+
+from .disk_store import DiskStore
+from .tracing import tracer
+
+def memory_budget(variable, default_mb):
+  """Reads a cache's memory budget (in MB) from the environment. 0 means unlimited."""
+  return int(float(environ.get(variable, default_mb)) * 1_000_000) or None
+
+class TextCache:
+  """
+  A cache of page contents, keyed by page title and revision ID.
+  Recently used pages are kept in memory, up to memory_budget bytes (if set). Beyond that, the least recently used
+  pages are evicted to disk: into the cache directory's sqlite database, which persists between runs so that only
+  changed pages need to be refetched, or without a cache directory, into a temporary database.
+  With a cache directory but no budget, pages are only kept on disk (e.g. for DumpWiki, so that loading a dump
+  doesn't hold the whole wiki in memory).
+  """
+
+  def __init__(self, cache_dir=None, *, memory_budget=None):
+    self.memory = OrderedDict() # title: (text, revid), least recently used first
+    self.memory_size = 0
+    self.memory_budget = memory_budget
+    self.spill = None
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    self.evictions = 0
+    # The cache is shared between all of the pagescraper threads, so we need to serialize access to it.
+    self.lock = Lock()
+    self.db = None
+    if cache_dir:
+      makedirs(cache_dir, exist_ok=True)
+      self.db = connect(path.join(cache_dir, 'wikitext.sqlite3'), check_same_thread=False, isolation_level=None)
+      self.db.execute('PRAGMA journal_mode=WAL')
+      self.db.execute('PRAGMA synchronous=NORMAL')
+      self.db.execute('CREATE TABLE IF NOT EXISTS pages (title TEXT PRIMARY KEY, revid INTEGER, text TEXT)')
+      self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+  @property
+  def persistent(self):
+    return self.db is not None
+
+  def __getitem__(self, title):
+    text = self.get(title)
+    if text is None:
+      raise KeyError(title)
+    return text
+
+  def get(self, title, default=None, *, revid=None):
+    with tracer.locked(self.lock, 'text cache'):
+      entry = self.memory.get(title)
+      if entry is not None:
+        self.memory.move_to_end(title)
+        self.hits += 1
+      else:
+        if self.db:
+          entry = self.db.execute('SELECT text, revid FROM pages WHERE title = ?', (title,)).fetchone()
+        elif self.spill is not None:
+          entry = self.spill.pop(title)
+        if entry is not None:
+          self.disk_hits += 1
+          self.remember(title, tuple(entry))
+        else:
+          self.misses += 1
+    if entry is None:
+      tracer.instant('text cache miss', 'cache', title=title)
+      return default
+    text, cached_revid = entry
+    if revid and cached_revid and revid != cached_revid:
+      tracer.instant('text cache miss', 'cache', title=title, stale=True)
+      return default # Cached contents are from a different revision
+    tracer.instant('text cache hit', 'cache', title=title)
+    return text
+
+  def __setitem__(self, title, text):
+    self.set(title, text)
+
+  def set(self, title, text, revid=None):
+    with tracer.locked(self.lock, 'text cache'):
+      if self.db:
+        self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?)', (title, revid, text))
+      self.remember(title, (text, revid))
+
+  def remember(self, title, entry):
+    # Must be called with the lock held
+    old_entry = self.memory.pop(title, None)
+    if old_entry is not None:
+      self.memory_size -= getsizeof(old_entry[0])
+    if self.db and not self.memory_budget:
+      return # Everything is on disk already, and without a budget, keeping a copy in memory would be unbounded
+    self.memory[title] = entry
+    self.memory_size += getsizeof(entry[0])
+
+    while self.memory_budget and self.memory_size > self.memory_budget and len(self.memory) > 1:
+      evicted_title, evicted_entry = self.memory.popitem(last=False)
+      self.memory_size -= getsizeof(evicted_entry[0])
+      self.evictions += 1
+      if not self.db: # Otherwise, the entry is already on disk
+        if self.spill is None:
+          self.spill = DiskStore()
+        self.spill.set(evicted_title, evicted_entry)
+
+  def __contains__(self, title):
+    # Only checks for the key, without loading the text or counting as a use of it
+    with tracer.locked(self.lock, 'text cache'):
+      if title in self.memory:
+        return True
+      if self.db:
+        return self.db.execute('SELECT 1 FROM pages WHERE title = ?', (title,)).fetchone() is not None
+      return self.spill is not None and title in self.spill
+
+  def discard(self, title):
+    with tracer.locked(self.lock, 'text cache'):
+      entry = self.memory.pop(title, None)
+      if entry is not None:
+        self.memory_size -= getsizeof(entry[0])
+      if self.db:
+        self.db.execute('DELETE FROM pages WHERE title = ?', (title,))
+      elif self.spill is not None:
+        self.spill.discard(title)
+
+  def clear(self):
+    with tracer.locked(self.lock, 'text cache'):
+      self.memory.clear()
+      self.memory_size = 0
+      if self.db:
+        self.db.execute('DELETE FROM pages')
+        self.db.execute('DELETE FROM meta')
+      elif self.spill is not None:
+        self.spill.clear()
+
+  def __len__(self):
+    with tracer.locked(self.lock, 'text cache'):
+      if self.db:
+        return self.db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+      return len(self.memory) + (len(self.spill) if self.spill is not None else 0)
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'disk_hits': self.disk_hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'memory_entries': len(self.memory),
+      'memory_bytes': self.memory_size,
+    }
+
+  # The watermark is the timestamp of the last reconciliation against recent changes.
+  @property
+  def watermark(self):
+    if not self.db:
+      return None
+    with tracer.locked(self.lock, 'text cache'):
+      row = self.db.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+    return row[0] if row else None
+
+  @watermark.setter
+  def watermark(self, timestamp):
+    with tracer.locked(self.lock, 'text cache'):
+      self.db.execute("INSERT OR REPLACE INTO meta VALUES ('watermark', ?)", (timestamp,))
@@ -0,0 +1,82 @@
+from atexit import register
+from contextlib import contextmanager
+from json import dumps
+from os import environ, getpid
+from threading import Lock, current_thread, get_ident
+from time import perf_counter_ns
+
+class Tracer:
+  """
+  Writes a timeline of the run in the Chrome trace event format (open it in chrome://tracing or ui.perfetto.dev),
+  with one track per thread: pagescraper calls, HTTP requests, cache hits and misses, and lock waits.
+  Events are streamed to the file as they happen, so long runs don't accumulate them in memory.
+  When disabled, every method is a cheap no-op.
+  """
+
+  def __init__(self, file_name=None):
+    self.enabled = bool(file_name)
+    if not self.enabled:
+      return
+    self.lock = Lock()
+    self.pid = getpid()
+    self.threads = set()
+    self.start = perf_counter_ns()
+    self.file = open(file_name, 'w', encoding='utf-8')
+    self.file.write('[')
+    self.separator = '\n'
+    register(self.close)
+
+  def close(self):
+    with self.lock:
+      if not self.file.closed:
+        self.file.write('\n]\n')
+        self.file.close()
+
+  def now(self):
+    return (perf_counter_ns() - self.start) / 1000 # Trace timestamps are in microseconds
+
+  def emit(self, event):
+    tid = get_ident()
+    event['pid'] = self.pid
+    event['tid'] = tid
+    with self.lock:
+      if self.file.closed:
+        return
+      if tid not in self.threads:
+        self.threads.add(tid)
+        metadata = {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': current_thread().name}}
+        self.file.write(self.separator + dumps(metadata))
+        self.separator = ',\n'
+      self.file.write(self.separator + dumps(event))
+      self.separator = ',\n'
+
+  @contextmanager
+  def span(self, name, category, *, min_duration=0, **args):
+    """Records the duration of the with block. The block can add more args to the yielded dict, e.g. a response status."""
+    if not self.enabled:
+      yield args
+      return
+    start = self.now()
+    try:
+      yield args
+    finally:
+      duration = self.now() - start
+      if duration >= min_duration:
+        self.emit({'name': name, 'cat': category, 'ph': 'X', 'ts': start, 'dur': duration, 'args': args})
+
+  def instant(self, name, category, **args):
+    if self.enabled:
+      self.emit({'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': self.now(), 'args': args})
+
+  @contextmanager
+  def locked(self, lock, name):
+    """Acquires lock for the with block, recording how long it took to acquire (if it had to wait at all)."""
+    with self.span(f'wait for {name}', 'lock', min_duration=50):
+      lock.acquire()
+    try:
+      yield
+    finally:
+      lock.release()
+
+# e.g. WIKI_TRACE=trace.json python master.py
+tracer = Tracer(environ.get('WIKI_TRACE'))
@@ -0,0 +1,95 @@
+from time import monotonic
+import requests
+
+from .governor import Governor, parse_retry_after
+from .metrics import Metrics, endpoint_name
+from .single_flight import SingleFlight
+from .tracing import tracer
+
+class Transport:
+  """
+  The single HTTP connection pool which every request from a Wiki goes through (API calls, page HTML, edits and uploads).
+  Connections are kept alive and reused, so that we don't pay for a TCP+TLS handshake on every request.
+  """
+
+  def __init__(self, *, num_workers=50, timeout=(10, 300), max_attempts=5, cassette=None):
+    self.timeout = timeout # (connect, read) in seconds. Reads are long because saving a large report can be slow.
+    self.max_attempts = max_attempts
+
+    # Retries are handled by the governor (rather than by urllib3) so that all threads back off together.
+    self.governor = Governor(max_in_flight=num_workers)
+
+    # One pool per host, sized so that every worker thread can hold a connection at once.
+    # pool_block makes extra threads wait for a free connection rather than opening (and then discarding) a new one.
+    adapter = requests.adapters.HTTPAdapter(
+      pool_connections=4, # Number of distinct hosts to keep pools for
+      pool_maxsize=num_workers,
+      pool_block=True,
+    )
+
+    # As of MediaWiki 1.27, logging in and remaining logged in requires correct HTTP cookie handling by your client on all requests.
+    self.session = requests.Session()
+    self.session.headers['Connection'] = 'keep-alive'
+    self.session.mount('https://', adapter)
+    self.session.mount('http://', adapter)
+
+    # If set, responses are recorded to (or replayed from) disk, see cassette.py
+    self.cassette = cassette
+
+    # Statistics for every attempt, including retries
+    self.metrics = Metrics()
+
+    # Threads which make the same GET request at the same time (e.g. two reports' threads loading the same page)
+    # share a single response, rather than each fetching it.
+    self.single_flight = SingleFlight()
+
+  def request(self, method, url, **kwargs):
+    kwargs.setdefault('timeout', self.timeout)
+    if method == 'GET' and not kwargs.get('stream'):
+      params = sorted((key, str(value)) for key, value in (kwargs.get('params') or {}).items())
+      headers = sorted((kwargs.get('headers') or {}).items()) # e.g. conditional requests
+      key = (url, tuple(params), tuple(headers), kwargs.get('allow_redirects', True))
+      return self.single_flight.do(key, self.send, method, url, **kwargs)
+    return self.send(method, url, **kwargs)
+
+  def send(self, method, url, **kwargs):
+    endpoint = endpoint_name(url, kwargs.get('params') or kwargs.get('data') or {})
+    for attempt in range(1, self.max_attempts + 1):
+      if attempt > 1:
+        for file in (kwargs.get('files') or {}).values():
+          file[1].seek(0) # Uploads need to be rewound before they can be resent
+
+      wait_start = monotonic()
+      with tracer.span('wait for governor', 'lock', min_duration=50):
+        self.governor.acquire()
+      start = monotonic()
+      try:
+        with tracer.span(f'{method} {endpoint}', 'http', attempt=attempt) as span:
+          if self.cassette:
+            r = self.cassette.request(self.session, method, url, **kwargs)
+          else:
+            r = self.session.request(method, url, **kwargs)
+          span.update(status=r.status_code, bytes=len(r.content))
+      except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        self.metrics.record(endpoint, status=type(e).__name__, latency=monotonic() - start, size=0, retry=attempt > 1, wait=start - wait_start)
+        self.governor.release(overloaded=True)
+        if attempt == self.max_attempts:
+          raise
+        continue
+      except BaseException:
+        self.governor.release()
+        raise
+
+      self.metrics.record(endpoint, status=r.status_code, latency=monotonic() - start, size=len(r.content), retry=attempt > 1, wait=start - wait_start)
+
+      overloaded = r.status_code in [429, 502, 503] or r.headers.get('MediaWiki-API-Error') == 'maxlag'
+      self.governor.release(overloaded=overloaded, retry_after=parse_retry_after(r.headers.get('Retry-After')))
+      if not overloaded:
+        break
+    return r
+
+  def get(self, url, **kwargs):
+    return self.request('GET', url, **kwargs)
+
+  def post(self, url, **kwargs):
+    return self.request('POST', url, **kwargs)
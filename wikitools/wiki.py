@@ -1,13 +1,20 @@
+from datetime import datetime, timedelta
 from os import environ
 from re import finditer
 import requests
 
+from .cassette import Cassette
+from .html_store import HtmlStore
 from .page import Page
-from .retry import StaticRetry
-from .zip_dict import ZipDict
+from .text_cache import TextCache, memory_budget
+from .transport import Transport
+from .compressed_dict import CompressedDict
+
+# Page lists which don't change (much) over the course of a run, and are requested by many reports.
+MEMOIZED_LISTS = ['allpages', 'embeddedin', 'categorymembers', 'allimages']
 
 class Wiki:
-  def __init__(self, api_url=None):
+  def __init__(self, api_url=None, cache_dir=None, num_workers=50, memoize_lists=False, cassette=None):
     env_api_url = environ.get("WIKI_API_URL")
     if env_api_url:
       self.api_url = env_api_url
@@ -15,24 +22,34 @@ class Wiki:
       self.api_url = api_url
     else:
       raise ValueError("No API URL provided. Please set the 'WIKI_API_URL' environment variable or provide a value for the 'api_url' argument")
-    self.wiki_url = api_url.replace('api.php', 'index.php')
+    self.wiki_url = self.api_url.replace('api.php', 'index.php')
     self.lgtoken = None
-    self.page_text_cache = {}
-    self.page_html_cache = ZipDict()
-
-    # https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
-    retry = StaticRetry(
-      total=1,
-      allowed_methods={'GET', 'POST'},
-      status_forcelist=[502, 503],
-      static_backoff=30, # 30 second fixed backoff (custom implementation)
-    )
-
-    # As of MediaWiki 1.27, logging in and remaining logged in requires correct HTTP cookie handling by your client on all requests.
-    self.session = requests.Session()
-    self.session.mount('https://', requests.adapters.HTTPAdapter(max_retries=retry))
+    self.csrf_token = None
+    # If a cache directory is provided, page contents and HTML are kept between runs and only refetched once they change.
+    # Both in-memory caches keep recently used pages up to a budget (WIKI_TEXT_CACHE_MB and WIKI_HTML_CACHE_MB),
+    # and evict the rest to disk.
+    cache_dir = cache_dir or environ.get('WIKI_CACHE_DIR')
+    self.page_text_cache = TextCache(cache_dir, memory_budget=memory_budget('WIKI_TEXT_CACHE_MB', 512))
+    self.page_html_cache = CompressedDict(memory_budget=memory_budget('WIKI_HTML_CACHE_MB', 256))
+    self.html_store = HtmlStore(cache_dir) if cache_dir else None
+    # When running many reports with one Wiki, remember page lists so that later reports don't need to reload them.
+    self.memoize_lists = memoize_lists
+    self.list_memo = {}
+    self.text_prefetched = set() # Namespaces whose page contents have all been loaded into the text cache
+
+    # All HTTP requests share one connection pool. num_workers should match the number of threads making requests (see pagescraper_queue).
+    # Responses can also be recorded to or replayed from a cassette, e.g. WIKI_CASSETTE=run.zip WIKI_CASSETTE_MODE=record
+    self.transport = Transport(num_workers=num_workers, cassette=cassette or Cassette.from_environ())
+    self.session = self.transport.session
+    self.governor = self.transport.governor
+    self.metrics = self.transport.metrics
+    # Ask the server to reject API requests while it is lagging. These rejections are retried by the governor.
+    # https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+    self.maxlag = 5
 
     self.namespaces = self.get_namespaces()
+    if self.page_text_cache.persistent:
+      self.reconcile_text_cache()
 
   def __eq__(self, other):
     return self.api_url == other.api_url
@@ -41,8 +58,9 @@ class Wiki:
     params.update({
       'action': action,
       'format': 'json',
+      'maxlag': self.maxlag,
     })
-    r = self.session.get(self.api_url, params=params)
+    r = self.transport.get(self.api_url, params=params)
     r.raise_for_status()
     j = r.json()
     if 'warnings' in j:
@@ -50,16 +68,45 @@ class Wiki:
     return j
 
   def get_with_continue(self, action, entry_key, **kwargs):
+    memo_key = self.get_memo_key(action, entry_key, kwargs)
+    if memo_key in self.list_memo:
+      yield from self.list_memo[memo_key]
+      return
+
+    entries = []
+    fetch = self.fetch_with_continue(action, entry_key, **kwargs)
+    while 1:
+      try:
+        entry = next(fetch)
+      except StopIteration as done:
+        if memo_key and done.value: # Only remember lists which were enumerated successfully and completely
+          self.list_memo[memo_key] = entries
+        return
+      if memo_key:
+        entries.append(entry)
+      yield entry
+
+  def get_memo_key(self, action, entry_key, kwargs):
+    if not self.memoize_lists:
+      return None
+    if kwargs.get('list') not in MEMOIZED_LISTS and kwargs.get('generator') not in MEMOIZED_LISTS:
+      return None
+    if 'revisions' in kwargs.get('prop', ''):
+      return None # Page contents have their own cache
+    return (action, entry_key, tuple(sorted((key, str(value)) for key, value in kwargs.items())))
+
+  def fetch_with_continue(self, action, entry_key, **kwargs):
+    # Yields each entry in the query, and returns True if the query was loaded completely.
     while 1:
       try:
         data = self.get(action, **kwargs)
       except requests.exceptions.RequestException:
-        return # Unable to load more info for this query
+        return False # Unable to load more info for this query
       if data == {'batchcomplete': ''}:
-        return # No entries for this query
+        return True # No entries for this query
       if 'error' in data:
         print('Error: ' + str(data['error']))
-        break
+        return False
 
       try:
         entries = data[action][entry_key]
@@ -68,7 +115,7 @@ class Wiki:
           print(f'Entry key "{entry_key}" was not found in data. Did you mean one of these keys: {", ".join(data.keys())}')
         else:
           print(f'Entry key "{entry_key}" was not found in data[{action}]. Did you mean one of these keys: {", ".join(data[action].keys())}')
-        break
+        return False
 
       if isinstance(entries, list):
         for entry in entries:
@@ -80,7 +127,7 @@ class Wiki:
       if 'continue' in data:
         kwargs.update(data['continue'])
       else:
-        break
+        return True
 
   def get_html_with_continue(self, title, **params):
     params.update({
@@ -89,7 +136,7 @@ class Wiki:
       'offset': 0,
     })
     while True:
-      r = self.session.get(self.wiki_url, params=params)
+      r = self.transport.get(self.wiki_url, params=params)
       if not r.ok:
         yield '' # Not sure this is the best approach, but some reports return a 404 when there is no more data
         return
@@ -106,15 +153,26 @@ class Wiki:
       'lgtoken': self.lgtoken,
       'action': action,
       'format': 'json',
+      'maxlag': self.maxlag,
     })
-    r = self.session.post(self.api_url, data=kwargs, files=files)
+    r = self.transport.post(self.api_url, data=kwargs, files=files)
     if r.status_code >= 500:
       r.raise_for_status()
     return r.json()
 
   def post_with_csrf(self, action, **kwargs):
-    kwargs['token'] = self.get('query', meta='tokens')['query']['tokens']['csrftoken']
-    return self.post_with_login(action, **kwargs)
+    # The CSRF token lasts as long as the session, so only fetch a new one when the old one is rejected.
+    for _ in range(2):
+      token = self.csrf_token
+      if not token:
+        token = self.csrf_token = self.get('query', meta='tokens')['query']['tokens']['csrftoken']
+      data = self.post_with_login(action, token=token, **kwargs)
+      error = data.get('error')
+      if not isinstance(error, dict) or error.get('code') != 'badtoken':
+        break
+      if self.csrf_token == token: # Another thread may have already refreshed it
+        self.csrf_token = None
+    return data
 
   def get_namespaces(self):
     namespaces = {}
@@ -123,20 +181,16 @@ class Wiki:
       siprop='namespaces'
     ):
       namespaces[namespace['*']] = namespace['id']
+      if 'canonical' in namespace:
+        namespaces.setdefault(namespace['canonical'], namespace['id']) # e.g. 'Project' for 'Team Fortress Wiki'
     namespaces['*'] = '*' # 'All', in many queries
     namespaces['Main'] = namespaces['']
     if 'Team Fortress Wiki' in namespaces:
       namespaces['TFW'] = namespaces['Team Fortress Wiki']
     return namespaces
 
-  def get_all_templates(self):
-    for entry in self.get_with_continue('query', 'allpages',
-      list='allpages',
-      aplimit=500,
-      apfilterredir='nonredirects', # Filter out redirects
-      apnamespace=self.namespaces['Template'],
-    ):
-      yield Page(self, entry['title'], entry)
+  def get_all_templates(self, *, with_text=False):
+    return self.get_all_pages(namespaces=['Template'], with_text=with_text)
 
   def get_all_users(self):
     return self.get_with_continue('query', 'allusers',
@@ -146,7 +200,8 @@ class Wiki:
       auwitheditsonly='true',
     )
 
-  def get_all_pages(self, *, namespaces=None, redirects=False):
+  def get_all_pages(self, *, namespaces=None, redirects=False, with_text=False, keep_raw=True):
+    # keep_raw=False drops each page's API entry, for reports which hold many pages but only need their titles.
     if namespaces is None:
       namespaces = ['Main']
     redirect_filter = {
@@ -156,6 +211,26 @@ class Wiki:
     }[redirects]
 
     for namespace in namespaces:
+      if with_text and not self.page_text_cache.persistent and namespace not in self.text_prefetched:
+        # Fetch the page contents alongside the page list, instead of making one parse request per page later.
+        for entry in self.get_with_continue('query', 'pages',
+          generator='allpages',
+          gaplimit=50, # Mediawiki only returns contents for 50 pages per request
+          gapnamespace=self.namespaces[namespace],
+          gapfilterredir=redirect_filter,
+          prop='revisions',
+          rvprop='content|ids',
+          rvslots='main',
+        ):
+          title = entry['title']
+          if title.endswith('.js') or title.endswith('.css'):
+            continue
+          if not self.cache_revision_text(entry):
+            continue # This page's contents will be in a later continuation, yield it then.
+          yield Page(self, title, entry)
+        continue
+
+      pages = []
       for entry in self.get_with_continue('query', 'allpages',
         list='allpages',
         aplimit=500,
@@ -165,7 +240,225 @@ class Wiki:
         title = entry['title']
         if title.endswith('.js') or title.endswith('.css'):
           continue
-        yield Page(self, title, entry)
+        page = Page(self, title, entry if keep_raw else None)
+        if not with_text:
+          yield page
+          continue
+
+        # With a persistent cache (or after prefetch), most page contents are already known, so we only need to fetch the ones which changed.
+        pages.append(page)
+        if len(pages) == 50:
+          self.prefetch_text(pages)
+          yield from pages
+          pages = []
+      if pages:
+        self.prefetch_text(pages)
+        yield from pages
+
+  def crawl(self, *, namespaces=None, redirects=False, props=('info',), **params):
+    # Enumerate all pages along with several properties of each (links, templates, categories, info, revisions),
+    # instead of making separate requests per page. Extra params are passed along, e.g. plnamespace to filter links.
+    # Returns True if every namespace was loaded completely.
+    if namespaces is None:
+      namespaces = ['Main']
+    redirect_filter = {
+      False: 'nonredirects',
+      True: 'redirects',
+      None: 'all',
+    }[redirects]
+
+    props = set(props)
+    query = {
+      'generator': 'allpages',
+      'gaplimit': 50 if 'revisions' in props else 500, # Mediawiki only returns contents for 50 pages per request
+      'gapfilterredir': redirect_filter,
+      'prop': '|'.join(sorted(props)),
+    }
+    if 'links' in props:
+      query['pllimit'] = 'max'
+    if 'templates' in props:
+      query['tllimit'] = 'max'
+    if 'categories' in props:
+      query['cllimit'] = 'max'
+    if 'revisions' in props:
+      query.update(rvprop='content|ids', rvslots='main')
+    query.update(params)
+
+    for namespace in namespaces:
+      query['gapnamespace'] = self.namespaces[namespace]
+      # Like other page lists, crawls can be remembered for later reports (but not page contents, which have their own cache).
+      memo_key = None
+      if self.memoize_lists and 'revisions' not in props:
+        memo_key = ('crawl', tuple(sorted((key, str(value)) for key, value in query.items())))
+      if memo_key in self.list_memo:
+        for entry in self.list_memo[memo_key]:
+          yield Page(self, entry['title'], entry)
+        continue
+      # A crawl of links to some namespaces can be answered from a crawl of links to all of them (e.g. from prefetch).
+      all_links_key = memo_key and ('crawl', tuple(item for item in memo_key[1] if item[0] != 'plnamespace'))
+      if 'plnamespace' in params and all_links_key in self.list_memo:
+        link_namespaces = str(params['plnamespace']).split('|')
+        for all_links_entry in self.list_memo[all_links_key]:
+          entry = {key: value for key, value in all_links_entry.items() if key != 'links'}
+          links = [link for link in all_links_entry.get('links', []) if str(link['ns']) in link_namespaces]
+          if links: # Like the API, which leaves out 'links' for pages without any
+            entry['links'] = links
+          yield Page(self, entry['title'], entry)
+        continue
+
+      entries = []
+      continue_params = {}
+      batch = {}
+      while True:
+        try:
+          data = self.get('query', **query, **continue_params)
+        except requests.exceptions.RequestException:
+          return False # Unable to load more info for this query
+        if 'error' in data:
+          print('Error: ' + str(data['error']))
+          return False
+
+        # Each property continues separately, so one page's links may be split across several responses.
+        # The generator only advances once every property is complete for the current batch of pages.
+        for pageid, entry in data.get('query', {}).get('pages', {}).items():
+          merged_entry = batch.setdefault(pageid, {})
+          for key, value in entry.items():
+            if isinstance(value, list):
+              merged_entry.setdefault(key, []).extend(value)
+            else:
+              merged_entry[key] = value
+
+        if 'batchcomplete' in data:
+          for entry in batch.values():
+            title = entry['title']
+            if title.endswith('.js') or title.endswith('.css'):
+              continue
+            if 'revisions' in props:
+              self.cache_revision_text(entry)
+            if memo_key:
+              entries.append(entry)
+            yield Page(self, title, entry)
+          batch = {}
+
+        if 'continue' not in data:
+          break
+        continue_params = data['continue'] # Replace (not update) the continuation, since stale continue keys confuse the API
+      if memo_key: # Only remember crawls which completed
+        self.list_memo[memo_key] = entries
+    return True
+
+  def prefetch(self, needs):
+    # Load the data which reports are going to read in bulk, so that it's fetched once no matter how many reports use it.
+    # needs maps each kind of data to the namespaces it's needed in, e.g. {'wikitext': {'Template'}, 'links': {'Main'}}:
+    # 'titles' are page lists and 'links' are crawls of each page's links (both kept by memoize_lists),
+    # 'wikitext' is page contents (kept in the text cache), 'categories' is the members of every category
+    # (see prefetch_category_pages), and 'html' is a crawl of page info.
+    # Returns the pages whose HTML is needed, since that's one request per page and best loaded from many threads.
+    # Once a namespace's contents are cached, reports load them by listing its pages (see get_all_pages), so list those too.
+    for namespace in sorted(set(needs.get('titles', ())) | set(needs.get('wikitext', ()))):
+      for _ in self.get_all_pages(namespaces=[namespace]):
+        pass
+    for namespace in sorted(needs.get('links', ())):
+      for _ in self.crawl(namespaces=[namespace], props=['links']):
+        pass
+    for namespace in sorted(needs.get('wikitext', ())):
+      for _ in self.get_all_pages(namespaces=[namespace], with_text=True):
+        pass
+      self.text_prefetched.add(namespace)
+    for namespace in sorted(needs.get('categories', ())):
+      self.prefetch_category_pages(namespace)
+    return [page for namespace in sorted(needs.get('html', ())) for page in self.crawl(namespaces=[namespace], props=['info'])]
+
+  def prefetch_category_pages(self, namespace):
+    # Finds the members of every category with one crawl of the namespace, rather than a request per category,
+    # and remembers them as if get_all_category_pages had listed each category (so only with memoize_lists).
+    if not self.memoize_lists:
+      return
+    members = {page.title: [] for page in self.get_all_categories(filter_redirects=False)}
+    crawl = self.crawl(namespaces=[namespace], redirects=None, props=['categories'])
+    while 1:
+      try:
+        page = next(crawl)
+      except StopIteration as done:
+        if not done.value:
+          return # Some pages are missing, so the members would be incomplete
+        break
+      for category in page.raw.get('categories', []):
+        members.setdefault(category['title'], []).append({'ns': page.raw['ns'], 'title': page.title})
+    for category, entries in members.items():
+      memo_key = self.get_memo_key('query', 'categorymembers', self.category_pages_query(category, namespace))
+      self.list_memo.setdefault(memo_key, sorted(entries, key=lambda entry: entry['title']))
+
+  def prefetch_text(self, pages):
+    titles = [page.title for page in pages if page.title not in self.page_text_cache]
+    for i in range(0, len(titles), 50): # Mediawiki only returns contents for 50 pages per request
+      for entry in self.get_with_continue('query', 'pages',
+        titles='|'.join(titles[i:i+50]),
+        prop='revisions',
+        rvprop='content|ids',
+        rvslots='main',
+      ):
+        self.cache_revision_text(entry)
+
+  def cache_revision_text(self, entry):
+    revisions = entry.pop('revisions', None)
+    if not revisions: # Missing page, or the contents were deferred to a continuation
+      return False
+    revid = revisions[0].get('revid')
+    content = revisions[0]['slots']['main'] if 'slots' in revisions[0] else revisions[0]
+    self.page_text_cache.set(entry['title'], content.get('*', ''), revid)
+    entry['lastrevid'] = revid # Keep the revision ID (but not the contents) on the page entry
+    return True
+
+  def reconcile_text_cache(self, max_age=timedelta(days=30)):
+    # Drop any cached pages which were edited, moved, or deleted since the last run.
+    now = datetime.utcnow()
+    watermark = self.page_text_cache.watermark
+    if watermark and now - datetime.strptime(watermark, r'%Y-%m-%dT%H:%M:%SZ') > max_age:
+      print(f'Text cache was last updated at {watermark}, which is too old to reconcile. Clearing it.')
+      self.page_text_cache.clear()
+    elif watermark:
+      def get_changes(list_name, **params):
+        while True:
+          data = self.get('query', list=list_name, **params)
+          if 'error' in data:
+            raise ValueError(data['error'])
+          yield from data['query'][list_name]
+          if 'continue' not in data:
+            return
+          params.update(data['continue'])
+
+      try:
+        changed_titles = set()
+        for entry in get_changes('recentchanges',
+          rcstart=watermark,
+          rcdir='newer',
+          rctype='edit|new',
+          rcprop='title',
+          rclimit=500,
+        ):
+          changed_titles.add(entry['title'])
+
+        for entry in get_changes('logevents',
+          lestart=watermark,
+          ledir='newer',
+          leprop='title|type|details',
+          lelimit=500,
+        ):
+          if entry['type'] == 'move':
+            changed_titles.add(entry['title'])
+            changed_titles.add(entry['params']['target_title'])
+          elif entry['type'] == 'delete':
+            changed_titles.add(entry['title'])
+      except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print(f'Failed to reconcile text cache, clearing it: {e}')
+        self.page_text_cache.clear()
+      else:
+        print(f'Text cache has {len(self.page_text_cache)} pages, dropping {len(changed_titles)} changed pages since {watermark}')
+        for title in changed_titles:
+          self.page_text_cache.discard(title)
+
+    self.page_text_cache.watermark = now.strftime(r'%Y-%m-%dT%H:%M:%SZ')
 
   def get_all_categories(self, filter_redirects=True):
     for entry in self.get_with_continue('query', 'allpages',
@@ -180,15 +473,18 @@ class Wiki:
     if namespaces is None:
       namespaces = ['Main']
     for namespace in namespaces:
-      for entry in self.get_with_continue('query', 'categorymembers',
-        list='categorymembers',
-        cmlimit=500,
-        cmtitle=category,
-        cmprop='title', # Only return page titles, not page IDs
-        cmnamespace=self.namespaces[namespace],
-      ):
+      for entry in self.get_with_continue('query', 'categorymembers', **self.category_pages_query(category, namespace)):
         yield Page(self, entry['title'], entry)
 
+  def category_pages_query(self, category, namespace):
+    return {
+      'list': 'categorymembers',
+      'cmlimit': 500,
+      'cmtitle': category,
+      'cmprop': 'title', # Only return page titles, not page IDs
+      'cmnamespace': self.namespaces[namespace],
+    }
+
   def get_all_files(self):
     for entry in self.get_with_continue('query', 'pages',
       generator='allimages',
@@ -223,6 +519,7 @@ class Wiki:
 
   def login(self, username, password=None):
     print(f'Logging in as {username}...')
+    self.csrf_token = None # Tokens belong to the session, which is about to change
     self.lgtoken = self.get('query',
       meta='tokens',
       type='login',